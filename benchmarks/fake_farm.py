@@ -0,0 +1,174 @@
+import asyncio
+import json
+import multiprocessing
+import random
+from dataclasses import dataclass, replace
+from server_list_ping import _pack_packet, _pack_string, _read_varint
+
+try:
+    import resource
+except ImportError:
+    # Windows, which has no per-process descriptor limit to raise
+    resource = None
+
+# Each responder is one listening socket on loopback, the client side needs
+# a descriptor per probe in flight on top of that
+_FDS_PER_SERVER = 3
+
+
+@dataclass
+class FarmProfile:
+    """How the fake servers behave, ratios are fractions of the farm"""
+    servers: int = 1000
+    latency: float = 0.02
+    jitter: float = 0.01
+    timeout_ratio: float = 0.05
+    malformed_ratio: float = 0.05
+    min_players: int = 0
+    max_players: int = 40
+    player_cap: int = 50
+    seed: int = 25565
+
+
+def _raise_fd_limit(needed):
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < needed:
+        target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+
+
+class FakeServerFarm:
+    """
+    Thousands of Minecraft status responders on 127.0.0.1, one port each.
+    A fixed share of them never answer (probes time out) or answer with
+    garbage, the rest reply after a simulated network latency.
+    """
+    def __init__(self, profile: FarmProfile = None, host="127.0.0.1"):
+        self.profile = profile or FarmProfile()
+        self.host = host
+        self.rng = random.Random(self.profile.seed)
+        self.servers = []
+        self.behaviour = {}
+        self.connections = 0
+
+    def _status_json(self):
+        online = self.rng.randint(self.profile.min_players, self.profile.max_players)
+        return json.dumps({
+            "version": {"name": "1.20.4", "protocol": 765},
+            "players": {"online": online, "max": max(online, self.rng.randint(1, self.profile.player_cap))},
+            "description": {"text": "A Minecraft Server", "extra": [{"text": " (benchmark)"}]},
+        })
+
+    def _handler(self, behaviour, body):
+        async def handle(reader, writer):
+            self.connections += 1
+            try:
+                # Handshake, then status request
+                length = await _read_varint(reader)
+                await reader.readexactly(length)
+                length = await _read_varint(reader)
+                await reader.readexactly(length)
+
+                if behaviour == "timeout":
+                    # Hold the connection open without answering until the client gives up
+                    await reader.read()
+                    return
+                await asyncio.sleep(max(0.0, self.profile.latency + self.rng.uniform(-1, 1) * self.profile.jitter))
+                if behaviour == "malformed":
+                    writer.write(_pack_packet(0x00, _pack_string("{not json")))
+                else:
+                    writer.write(_pack_packet(0x00, _pack_string(body)))
+                await writer.drain()
+            except (asyncio.IncompleteReadError, ConnectionError):
+                pass
+            finally:
+                writer.close()
+        return handle
+
+    async def start(self) -> list[tuple[str, int]]:
+        """Start every responder, returns their (ip, port) targets"""
+        _raise_fd_limit(self.profile.servers * _FDS_PER_SERVER + 1024)
+        targets = []
+        for _ in range(self.profile.servers):
+            roll = self.rng.random()
+            if roll < self.profile.timeout_ratio:
+                behaviour = "timeout"
+            elif roll < self.profile.timeout_ratio + self.profile.malformed_ratio:
+                behaviour = "malformed"
+            else:
+                behaviour = "ok"
+            server = await asyncio.start_server(self._handler(behaviour, self._status_json()), self.host, 0)
+            port = server.sockets[0].getsockname()[1]
+            self.servers.append(server)
+            self.behaviour[port] = behaviour
+            targets.append((self.host, port))
+        return targets
+
+    def expected(self, behaviour):
+        return sum(1 for b in self.behaviour.values() if b == behaviour)
+
+    async def stop(self):
+        for server in self.servers:
+            server.close()
+        await asyncio.gather(*(server.wait_closed() for server in self.servers), return_exceptions=True)
+        self.servers = []
+
+
+def _farm_main(profile, conn):
+    async def main():
+        farm = FakeServerFarm(profile)
+        targets = await farm.start()
+        conn.send((targets, farm.behaviour))
+        # Serve until the parent asks to stop
+        await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+        await farm.stop()
+
+    asyncio.run(main())
+
+
+class FarmProcess:
+    """
+    Runs the FakeServerFarm in separate processes, so the responders do not
+    compete with the code under test for the benchmark's event loop. One
+    Python process tops out at a few thousand status replies per second,
+    spread big farms over several.
+    """
+    def __init__(self, profile: FarmProfile = None, processes=1):
+        self.profile = profile or FarmProfile()
+        self.processes = max(1, processes)
+        self.behaviour = {}
+        self._children = []
+
+    def start(self) -> list[tuple[str, int]]:
+        ctx = multiprocessing.get_context("spawn")
+        for i in range(self.processes):
+            share = self.profile.servers // self.processes + (1 if i < self.profile.servers % self.processes else 0)
+            profile = replace(self.profile, servers=share, seed=self.profile.seed + i)
+            conn, child_conn = ctx.Pipe()
+            process = ctx.Process(target=_farm_main, args=(profile, child_conn), name=f"fake-farm-{i}", daemon=True)
+            process.start()
+            self._children.append((process, conn))
+
+        targets = []
+        for _, conn in self._children:
+            child_targets, behaviour = conn.recv()
+            targets.extend(child_targets)
+            self.behaviour.update(behaviour)
+        return targets
+
+    def expected(self, behaviour):
+        return sum(1 for b in self.behaviour.values() if b == behaviour)
+
+    def stop(self):
+        for process, conn in self._children:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for process, _ in self._children:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._children = []
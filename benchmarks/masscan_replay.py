@@ -0,0 +1,46 @@
+import json
+import time
+from masscan_wrapper import MasscanWrapper
+
+
+def synthetic_list_output(count, port=25565, seed_ip=0x0A000001):
+    """Masscan -oL lines for `count` open ports on consecutive 10.x addresses"""
+    now = int(time.time())
+    lines = ["#masscan"]
+    for i in range(count):
+        ip = seed_ip + i
+        lines.append(f"open tcp {port} {ip >> 24}.{(ip >> 16) & 255}.{(ip >> 8) & 255}.{ip & 255} {now}")
+    lines.append("# end")
+    return lines
+
+
+def load_recorded(path):
+    """
+    (ip, port) hits of a recorded masscan run, either -oJ output like
+    masscan_out.json or -oL list output
+    """
+    with open(path, "r") as f:
+        content = f.read().strip()
+    if content.startswith("["):
+        # Interrupted runs can be missing the closing bracket
+        if not content.endswith("]"):
+            content += "]"
+        return [
+            (entry.get("ip"), p.get("port"))
+            for entry in json.loads(content)
+            for p in entry.get("ports", [])
+        ]
+    return [hit for hit in map(MasscanWrapper._parse_list_line, content.splitlines()) if hit]
+
+
+def replay_onto(hits, targets):
+    """
+    Map masscan hits onto fake farm targets, in order and round-robin, so a
+    recorded scan drives the benchmark without touching the real addresses
+    """
+    return [targets[i % len(targets)] for i in range(len(hits))]
+
+
+def parse_list_lines(lines):
+    """Run -oL lines through the same parser the streaming scan uses"""
+    return [hit for hit in map(MasscanWrapper._parse_list_line, lines) if hit]
@@ -0,0 +1,292 @@
+"""
+Throughput benchmarks against a fake Minecraft server farm on loopback.
+
+    python -m benchmarks.run --servers 2000 --concurrency 500
+    python -m benchmarks.run --masscan-json masscan_runs/.../masscan_out.json --json bench.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from config import CONFIG
+from db_handler import DatabaseHandler
+from mcstatus_scanner import MCStatusScanner
+from metrics import PING_RTT
+from ping_workers import iter_stage, ping_stage
+from queue_manager import DEDUP_ENQUEUE_SCRIPT, TaskQueue
+from benchmarks.fake_farm import FarmProcess, FarmProfile, _raise_fd_limit
+from benchmarks.masscan_replay import load_recorded, parse_list_lines, replay_onto, synthetic_list_output
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def _ms(seconds):
+    return "n/a" if seconds is None else f"{seconds * 1000:.1f} ms"
+
+
+async def _take(source, count):
+    """First `count` items of an endless async iterator"""
+    if count <= 0:
+        return
+    async for item in source:
+        yield item
+        count -= 1
+        if count == 0:
+            return
+
+
+def _scanner(timeout, adaptive):
+    scanner = MCStatusScanner(adaptive=adaptive)
+    scanner.connect_timeout = scanner.handshake_timeout = scanner.read_timeout = timeout
+    return scanner
+
+
+def bench_masscan_parse(count):
+    lines = synthetic_list_output(count)
+    started = time.perf_counter()
+    hits = parse_list_lines(lines)
+    elapsed = time.perf_counter() - started
+    return {"hits": len(hits), "hits_per_sec": len(hits) / elapsed}
+
+
+async def bench_scanner(targets, concurrency, timeout, adaptive):
+    scanner = _scanner(timeout, adaptive)
+    rtt_before = PING_RTT.snapshot()
+    started = time.perf_counter()
+    answered = 0
+    async for _ in scanner.stream_scan(targets, limit=concurrency):
+        answered += 1
+    elapsed = time.perf_counter() - started
+    return {
+        "targets": len(targets),
+        "answered": answered,
+        "pings_per_sec": len(targets) / elapsed,
+        "rtt_p50": PING_RTT.quantile(0.5, since=rtt_before),
+        "rtt_p95": PING_RTT.quantile(0.95, since=rtt_before),
+    }
+
+
+async def bench_queue(queue, count, batch_size=500):
+    tasks = [{"ip": f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}", "port": 25565} for i in range(count)]
+    started = time.perf_counter()
+    for i in range(0, count, batch_size):
+        await queue.enqueue_batch(tasks[i:i + batch_size], stage="raw")
+    enqueue_elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    received = 0
+    while received < count:
+        batch = await queue.dequeue_batch(batch_size, "raw", timeout=1)
+        if not batch:
+            break
+        received += len(batch)
+    dequeue_elapsed = time.perf_counter() - started
+    return {
+        "tasks": count,
+        "enqueue_per_sec": count / enqueue_elapsed,
+        "dequeue_per_sec": received / dequeue_elapsed,
+    }
+
+
+async def bench_pipeline(queue, db, hits, concurrency, timeout, adaptive):
+    """raw stage -> ping -> database, timing each target from enqueue until it is handed to the writer"""
+    enqueued_at = {}
+    latencies = []
+    saved = 0
+
+    async def emit(res):
+        nonlocal saved
+        db.save_server(res)
+        saved += 1
+        latencies.append(time.perf_counter() - enqueued_at[(res["ip"], res["port"])])
+
+    started = time.perf_counter()
+    tasks = [{"ip": ip, "port": port} for ip, port in hits]
+    now = time.perf_counter()
+    for task in tasks:
+        enqueued_at[(task["ip"], task["port"])] = now
+    await queue.enqueue_batch(tasks, stage="raw", dedup=False)
+
+    await ping_stage(_scanner(timeout, adaptive), _take(iter_stage(queue, "raw", concurrency), len(tasks)), concurrency, emit)
+    await asyncio.to_thread(db.flush)
+    elapsed = time.perf_counter() - started
+    return {
+        "targets": len(tasks),
+        "saved": saved,
+        "targets_per_sec": len(tasks) / elapsed,
+        "e2e_p50": _percentile(latencies, 0.5),
+        "e2e_p95": _percentile(latencies, 0.95),
+    }
+
+
+def bench_db(path, count, batch_size):
+    db = DatabaseHandler(path, batch_size=batch_size)
+    try:
+        started = time.perf_counter()
+        for i in range(count):
+            db.save_server({
+                "ip": f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}", "port": 25565,
+                "online": i % 10, "max_online": 20, "motd": "A Minecraft Server", "version": "1.20.4"
+            })
+        db.flush()
+        elapsed = time.perf_counter() - started
+    finally:
+        db.close()
+    return {"rows": count, "rows_per_sec": count / elapsed}
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@asynccontextmanager
+async def redis_queue(mode):
+    """
+    TaskQueue on a throwaway local redis-server, or on fakeredis as a
+    stand-in when no server binary is installed. Yields None if neither is available.
+    """
+    server_path = shutil.which("redis-server")
+    if mode in ("auto", "server") and server_path:
+        port = _free_port()
+        process = subprocess.Popen(
+            [server_path, "--port", str(port), "--save", "", "--appendonly", "no"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            queue = TaskQueue(use_redis=True, host="127.0.0.1", port=port)
+            for _ in range(50):
+                try:
+                    await queue.redis.ping()
+                    break
+                except Exception:
+                    await asyncio.sleep(0.1)
+            yield "redis-server", queue
+            await queue.redis.aclose()
+        finally:
+            process.terminate()
+            process.wait()
+        return
+
+    if mode in ("auto", "fake"):
+        try:
+            import fakeredis
+        except ImportError:
+            fakeredis = None
+        if fakeredis is not None:
+            queue = TaskQueue(use_redis=True)
+            queue.redis = fakeredis.FakeAsyncRedis()
+            queue._dedup_enqueue = queue.redis.register_script(DEDUP_ENQUEUE_SCRIPT)
+            yield "fakeredis", queue
+            return
+
+    yield None, None
+
+
+async def run(args):
+    report = {}
+    profile = FarmProfile(
+        servers=args.servers, latency=args.latency, jitter=args.jitter,
+        timeout_ratio=args.timeout_ratio, malformed_ratio=args.malformed_ratio
+    )
+    farm = FarmProcess(profile, processes=args.farm_processes)
+    targets = await asyncio.to_thread(farm.start)
+    _raise_fd_limit(args.concurrency * 2 + 1024)
+    print(f"Fake farm: {len(targets)} servers ({farm.expected('timeout')} silent, "
+          f"{farm.expected('malformed')} malformed), {args.latency * 1000:.0f}±{args.jitter * 1000:.0f} ms latency")
+
+    try:
+        result = report["masscan_parse"] = bench_masscan_parse(args.tasks)
+        print(f"masscan -oL parse    {result['hits_per_sec']:>12,.0f} hits/s")
+
+        if args.masscan_json:
+            hits = replay_onto(load_recorded(args.masscan_json), targets)
+            print(f"Replaying {len(hits)} recorded masscan hits from {args.masscan_json}")
+        else:
+            hits = targets
+
+        result = report["scanner"] = await bench_scanner(hits, args.concurrency, args.ping_timeout, not args.fixed_concurrency)
+        print(f"MCStatusScanner      {result['pings_per_sec']:>12,.0f} pings/s | {result['answered']}/{result['targets']} answered"
+              f" | RTT p50 {_ms(result['rtt_p50'])} p95 {_ms(result['rtt_p95'])}")
+
+        work_dir = tempfile.mkdtemp(prefix="mcscanner-bench-")
+        try:
+            result = report["db"] = await asyncio.to_thread(
+                bench_db, os.path.join(work_dir, "bench.db"), args.db_rows, CONFIG["DB_BATCH_SIZE"]
+            )
+            print(f"DatabaseHandler      {result['rows_per_sec']:>12,.0f} rows/s")
+
+            queues = [("local", TaskQueue(use_redis=False))]
+            async with redis_queue(args.redis) as (name, queue):
+                if queue is not None:
+                    queues.append((name, queue))
+                else:
+                    print("TaskQueue (redis)    skipped, neither redis-server nor fakeredis is available")
+
+                for name, queue in queues:
+                    result = report[f"queue_{name}"] = await bench_queue(queue, args.tasks)
+                    print(f"TaskQueue ({name}){'':<{max(0, 9 - len(name))}} {result['enqueue_per_sec']:>12,.0f} enqueued/s"
+                          f" | {result['dequeue_per_sec']:,.0f} dequeued/s")
+
+                    db = DatabaseHandler(os.path.join(work_dir, f"pipeline-{name}.db"))
+                    try:
+                        result = report[f"pipeline_{name}"] = await bench_pipeline(
+                            queue, db, hits, args.concurrency, args.ping_timeout, not args.fixed_concurrency
+                        )
+                    finally:
+                        db.close()
+                    print(f"Pipeline ({name}){'':<{max(0, 10 - len(name))}} {result['targets_per_sec']:>12,.0f} targets/s"
+                          f" | {result['saved']} saved | end-to-end p50 {_ms(result['e2e_p50'])} p95 {_ms(result['e2e_p95'])}")
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    finally:
+        await asyncio.to_thread(farm.stop)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote results to {args.json}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MCScanner throughput benchmarks on a local fake server farm")
+    parser.add_argument("--servers", type=int, default=1000, help="Fake Minecraft servers to start on loopback")
+    parser.add_argument("--farm-processes", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="Processes hosting the fake servers, so they are not the bottleneck")
+    parser.add_argument("--latency", type=float, default=0.02, help="Mean simulated reply latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.01, help="Max deviation from the mean latency in seconds")
+    parser.add_argument("--timeout-ratio", type=float, default=0.05, help="Share of servers that never answer")
+    parser.add_argument("--malformed-ratio", type=float, default=0.05, help="Share of servers that answer with garbage")
+    parser.add_argument("--concurrency", type=int, default=CONFIG["PING_CONCURRENCY"], help="Pings in flight")
+    parser.add_argument("--fixed-concurrency", action="store_true",
+                        help="Keep --concurrency pings in flight instead of letting the adaptive controller tune it")
+    parser.add_argument("--ping-timeout", type=float, default=1.0, help="Per-phase ping timeout in seconds")
+    parser.add_argument("--tasks", type=int, default=100000, help="Tasks for the queue and masscan parse benchmarks")
+    parser.add_argument("--db-rows", type=int, default=50000, help="Rows for the database benchmark")
+    parser.add_argument("--masscan-json", help="Replay a recorded masscan -oJ/-oL output onto the fake farm")
+    parser.add_argument("--redis", choices=["auto", "server", "fake", "off"], default="auto",
+                        help="Redis queue backend: a temporary redis-server, fakeredis, or skip")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    # Per-batch info logs would dominate the timings
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import logging
+from collections import deque
+from typing import Optional
+from config import CONFIG
+from metrics import PING_LIMIT, PING_TIMEOUT_SECONDS
+
+SUCCESS = "success"
+TIMEOUT = "timeout"
+CONNECT_ERROR = "connect_error"
+# Answered, but not like a Minecraft server. Says nothing about congestion
+OTHER = "other"
+
+# Successful RTT samples needed before the timeout is derived from them
+MIN_RTT_SAMPLES = 50
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit for probes in flight. Outcomes are judged once per window
+    (about one limit's worth of probes). The limit grows additively while
+    failures and median RTT stay near their baselines, and is cut
+    multiplicatively when timeouts/connect errors spike or RTT inflates.
+    Also derives the probe timeout from a high percentile of recent RTTs.
+    """
+    def __init__(self, initial=None, min_limit=None, max_limit=None, max_timeout=5.0):
+        self.min_limit = min_limit or CONFIG["PING_ADAPTIVE_MIN"]
+        self.max_limit = max_limit or CONFIG["PING_CONCURRENCY"]
+        self.limit = float(min(max(initial or CONFIG["PING_ADAPTIVE_INITIAL"], self.min_limit), self.max_limit))
+        self.step = CONFIG["PING_ADAPTIVE_STEP"]
+        self.backoff = CONFIG["PING_ADAPTIVE_BACKOFF"]
+        self.failure_spike = CONFIG["PING_ADAPTIVE_FAILURE_SPIKE"]
+        self.rtt_tolerance = CONFIG["PING_ADAPTIVE_RTT_TOLERANCE"]
+        self.timeout_percentile = CONFIG["PING_TIMEOUT_PERCENTILE"]
+        self.timeout_multiplier = CONFIG["PING_TIMEOUT_MULTIPLIER"]
+        self.min_timeout = CONFIG["PING_MIN_TIMEOUT"]
+        self.max_timeout = max_timeout
+
+        self.rtts = deque(maxlen=2000)
+        self._window = {SUCCESS: 0, TIMEOUT: 0, CONNECT_ERROR: 0, OTHER: 0}
+        self._window_rtts = []
+        self.baseline_rtt: Optional[float] = None
+        self.baseline_failure: Optional[float] = None
+        self._timeout = max_timeout
+        self.increases = 0
+        self.decreases = 0
+        self._publish()
+
+    def _publish(self):
+        PING_LIMIT.set(self.current_limit)
+        PING_TIMEOUT_SECONDS.set(self._timeout)
+
+    @property
+    def current_limit(self) -> int:
+        return int(self.limit)
+
+    def set_max_limit(self, max_limit: int):
+        """Change the ceiling, pulling the current limit down to it if needed"""
+        self.max_limit = max_limit
+        self.limit = max(min(self.limit, max_limit), min(self.min_limit, max_limit))
+        self._publish()
+
+    def timeout(self) -> float:
+        """Probe timeout in seconds, max_timeout until enough RTTs are known"""
+        return self._timeout
+
+    def record(self, outcome: str, rtt: Optional[float] = None):
+        self._window[outcome] += 1
+        if outcome == SUCCESS and rtt is not None:
+            self.rtts.append(rtt)
+            self._window_rtts.append(rtt)
+        if sum(self._window.values()) >= max(MIN_RTT_SAMPLES, self.current_limit):
+            self._adjust()
+
+    def _adjust(self):
+        total = sum(self._window.values())
+        failure_rate = (self._window[TIMEOUT] + self._window[CONNECT_ERROR]) / total
+        median_rtt = _percentile(self._window_rtts, 0.5) if self._window_rtts else None
+
+        if self.baseline_failure is None:
+            self.baseline_failure = failure_rate
+        if median_rtt is not None:
+            # Let the baseline creep up so a lasting route change is accepted eventually
+            self.baseline_rtt = median_rtt if self.baseline_rtt is None else min(median_rtt, self.baseline_rtt * 1.05)
+
+        congested = failure_rate > self.baseline_failure + self.failure_spike or (
+            median_rtt is not None and median_rtt > self.baseline_rtt * self.rtt_tolerance
+        )
+        if congested:
+            self.limit = max(self.min_limit, self.limit * self.backoff)
+            self.decreases += 1
+            logging.debug(f"Ping stage congested (failures {failure_rate:.0%}, median RTT {median_rtt}), limit -> {self.current_limit}")
+        else:
+            # Hit ratios of a healthy link drift with the targets, follow them slowly
+            self.baseline_failure = 0.9 * self.baseline_failure + 0.1 * failure_rate
+            if self.limit < self.max_limit:
+                self.limit = min(self.max_limit, self.limit + self.step)
+                self.increases += 1
+
+        if len(self.rtts) >= MIN_RTT_SAMPLES:
+            derived = _percentile(self.rtts, self.timeout_percentile) * self.timeout_multiplier
+            self._timeout = min(self.max_timeout, max(self.min_timeout, derived))
+
+        self._window = dict.fromkeys(self._window, 0)
+        self._window_rtts = []
+        self._publish()
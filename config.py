@@ -10,18 +10,79 @@ def get_default_masscan_path():
         return "masscan.exe"
     return "masscan"
 
+def parse_watermarks(value):
+    """Parse 'stage=high:low,...' into {stage: (high, low)}"""
+    watermarks = {}
+    for entry in value.split(","):
+        if not entry.strip():
+            continue
+        stage, limits = entry.split("=")
+        high, low = (int(x) for x in limits.split(":"))
+        watermarks[stage.strip()] = (high, low)
+    return watermarks
+
 CONFIG = {
     "MASSCAN_PATH": os.getenv("MASSCAN_PATH", get_default_masscan_path()),
     "SCAN_RATE": int(os.getenv("SCAN_RATE", 1000)),
+    "MASSCAN_SHARD": os.getenv("MASSCAN_SHARD", "1/1"),
+    "MASSCAN_SEED": int(os.getenv("MASSCAN_SEED", 25565)),
+    "MASSCAN_WORK_DIR": os.getenv("MASSCAN_WORK_DIR", "masscan_runs"),
+    "MASSCAN_STREAM": os.getenv("MASSCAN_STREAM", "true").lower() == "true",
+    "MASSCAN_BATCH_SIZE": int(os.getenv("MASSCAN_BATCH_SIZE", 100)),
+    "MASSCAN_FLUSH_INTERVAL": float(os.getenv("MASSCAN_FLUSH_INTERVAL", 2)),
+    "MASSCAN_SPILL_MEMORY": int(os.getenv("MASSCAN_SPILL_MEMORY", 50000)),
     "THREADS": int(os.getenv("THREADS", 10)),
+    "SCRAPER_PAGES": int(os.getenv("SCRAPER_PAGES", 3)),
+    "SCRAPER_PER_HOST_LIMIT": int(os.getenv("SCRAPER_PER_HOST_LIMIT", 2)),
+    "SCRAPER_MAX_CONNECTIONS": int(os.getenv("SCRAPER_MAX_CONNECTIONS", 20)),
+    "SCRAPER_PARSE_PROCESSES": int(os.getenv("SCRAPER_PARSE_PROCESSES", 0)),
+    "SCRAPER_CACHE_DIR": os.getenv("SCRAPER_CACHE_DIR", "scraper_cache"),
+    "SCRAPER_CACHE_MAX_AGE": int(os.getenv("SCRAPER_CACHE_MAX_AGE", 300)),
+    "SCRAPER_TIMEOUT": float(os.getenv("SCRAPER_TIMEOUT", 15)),
     "PROXY_LIST": os.getenv("PROXY_LIST", "proxies.txt"),
     "USE_REDIS": os.getenv("USE_REDIS", "false").lower() == "true",
     "REDIS_HOST": os.getenv("REDIS_HOST", "localhost"),
     "REDIS_PORT": int(os.getenv("REDIS_PORT", 6379)),
+    "QUEUE_DEDUP_TTL": int(os.getenv("QUEUE_DEDUP_TTL", 86400)),
+    "QUEUE_WATERMARKS": parse_watermarks(os.getenv("QUEUE_WATERMARKS", "raw=500000:250000,pinged=10000:5000,enriched=1000:500")),
+    "QUEUE_BLOCK_TIMEOUT": float(os.getenv("QUEUE_BLOCK_TIMEOUT", 5)),
+    "METRICS_HOST": os.getenv("METRICS_HOST", "127.0.0.1"),
+    "METRICS_PORT": int(os.getenv("METRICS_PORT", 0)),
+    "EXCLUDE_FILE": os.getenv("EXCLUDE_FILE", ""),
+    "EXCLUDE_RELOAD_INTERVAL": float(os.getenv("EXCLUDE_RELOAD_INTERVAL", 30)),
     "WEBHOOK_URL": os.getenv("WEBHOOK_URL", ""),
+    "WEBHOOK_QUEUE_SIZE": int(os.getenv("WEBHOOK_QUEUE_SIZE", 200)),
+    "WEBHOOK_BATCH_INTERVAL": float(os.getenv("WEBHOOK_BATCH_INTERVAL", 2)),
+    "WEBHOOK_TIMEOUT": float(os.getenv("WEBHOOK_TIMEOUT", 10)),
+    # Deep checks (whitelist/join tests) in flight per process
     "CONCURRENCY_LIMIT": int(os.getenv("CONCURRENCY_LIMIT", 50)),
+    # Status pings in flight per ping stage (per process with --processes)
+    "PING_CONCURRENCY": int(os.getenv("PING_CONCURRENCY", 500)),
     "PROXY_API_URL": os.getenv("PROXY_API_URL", "https://api.proxyscrape.com/v4/free-proxy-list/get?request=displayproxies&protocol=http,https&timeout=6000&country=all&ssl=all&anonymity=all"),
     "TARGET_PLAYER_MAX": 8,
     "SERVER_PLAYER_CAP": 60,
-    "WHITELIST_CHECK_TIMEOUT": 30
+    "WHITELIST_CHECK_TIMEOUT": 30,
+    "BLOCKING_POOL_SIZE": int(os.getenv("BLOCKING_POOL_SIZE", 8)),
+    "LOOP_LAG_INTERVAL": float(os.getenv("LOOP_LAG_INTERVAL", 0.5)),
+    "LOOP_LAG_THRESHOLD": float(os.getenv("LOOP_LAG_THRESHOLD", 0.25)),
+    "RECHECK_TTL": int(os.getenv("RECHECK_TTL", 21600)),
+    "RECHECK_CACHE_SIZE": int(os.getenv("RECHECK_CACHE_SIZE", 500000)),
+    "RECHECK_INTERVAL": int(os.getenv("RECHECK_INTERVAL", 600)),
+    "RECHECK_BATCH_SIZE": int(os.getenv("RECHECK_BATCH_SIZE", 1000)),
+    "DB_BATCH_SIZE": int(os.getenv("DB_BATCH_SIZE", 100)),
+    "DB_FLUSH_INTERVAL": float(os.getenv("DB_FLUSH_INTERVAL", 1)),
+    "PING_CONNECT_TIMEOUT": float(os.getenv("PING_CONNECT_TIMEOUT", 3)),
+    "PING_HANDSHAKE_TIMEOUT": float(os.getenv("PING_HANDSHAKE_TIMEOUT", 2)),
+    "PING_READ_TIMEOUT": float(os.getenv("PING_READ_TIMEOUT", 5)),
+    # AIMD control of pings in flight, PING_CONCURRENCY becomes the ceiling
+    "PING_ADAPTIVE": os.getenv("PING_ADAPTIVE", "true").lower() == "true",
+    "PING_ADAPTIVE_INITIAL": int(os.getenv("PING_ADAPTIVE_INITIAL", 100)),
+    "PING_ADAPTIVE_MIN": int(os.getenv("PING_ADAPTIVE_MIN", 20)),
+    "PING_ADAPTIVE_STEP": int(os.getenv("PING_ADAPTIVE_STEP", 20)),
+    "PING_ADAPTIVE_BACKOFF": float(os.getenv("PING_ADAPTIVE_BACKOFF", 0.7)),
+    "PING_ADAPTIVE_FAILURE_SPIKE": float(os.getenv("PING_ADAPTIVE_FAILURE_SPIKE", 0.1)),
+    "PING_ADAPTIVE_RTT_TOLERANCE": float(os.getenv("PING_ADAPTIVE_RTT_TOLERANCE", 2.0)),
+    "PING_TIMEOUT_PERCENTILE": float(os.getenv("PING_TIMEOUT_PERCENTILE", 0.99)),
+    "PING_TIMEOUT_MULTIPLIER": float(os.getenv("PING_TIMEOUT_MULTIPLIER", 3)),
+    "PING_MIN_TIMEOUT": float(os.getenv("PING_MIN_TIMEOUT", 0.5))
 }
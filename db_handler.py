@@ -1,43 +1,237 @@
+import atexit
+import hashlib
+import queue
 import sqlite3
 import logging
+import threading
+import time
 from datetime import datetime
+from config import CONFIG
+from metrics import DB_FLUSH_SECONDS, DB_ROWS_WRITTEN
+
+_STOP = object()
+
+# Schema migrations, applied in order and tracked with PRAGMA user_version.
+# Never edit an entry once released, append a new one instead.
+MIGRATIONS = [
+    # 1: latest state per server
+    '''
+    CREATE TABLE IF NOT EXISTS servers (
+        ip TEXT,
+        port INTEGER,
+        online INTEGER,
+        max_online INTEGER,
+        motd TEXT,
+        version TEXT,
+        cracked BOOLEAN,
+        is_whitelisted BOOLEAN,
+        plugins TEXT,
+        last_checked TIMESTAMP,
+        notes TEXT,
+        PRIMARY KEY (ip, port)
+    )
+    ''',
+    # 2: append-only observation history, secondary indexes, backfill from servers
+    '''
+    CREATE TABLE IF NOT EXISTS observations (
+        ip TEXT NOT NULL,
+        port INTEGER NOT NULL,
+        observed_at TIMESTAMP NOT NULL,
+        online INTEGER,
+        max_online INTEGER,
+        version TEXT,
+        motd_hash TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_observations_server ON observations (ip, port, observed_at);
+    CREATE INDEX IF NOT EXISTS idx_observations_observed_at ON observations (observed_at);
+    CREATE INDEX IF NOT EXISTS idx_servers_last_checked ON servers (last_checked);
+    CREATE INDEX IF NOT EXISTS idx_servers_version ON servers (version);
+    CREATE INDEX IF NOT EXISTS idx_servers_is_whitelisted ON servers (is_whitelisted);
+    INSERT INTO observations (ip, port, observed_at, online, max_online, version, motd_hash)
+        SELECT ip, port, last_checked, online, max_online, version, motd_hash(motd)
+        FROM servers WHERE last_checked IS NOT NULL
+    ''',
+    # 3: incremental exports filter on is_whitelisted and walk last_checked in order
+    '''
+    CREATE INDEX IF NOT EXISTS idx_servers_whitelisted_checked ON servers (is_whitelisted, last_checked);
+    DROP INDEX IF EXISTS idx_servers_is_whitelisted
+    ''',
+]
+
+
+def motd_hash(motd):
+    """Short stable hash of a MOTD, enough to tell when it changed"""
+    if motd is None:
+        return None
+    return hashlib.blake2b(str(motd).encode("utf-8"), digest_size=8).hexdigest()
+
 
 class DatabaseHandler:
-    def __init__(self, db_path="servers.db"):
+    def __init__(self, db_path="servers.db", batch_size=None, flush_interval=None):
         self.db_path = db_path
+        self.batch_size = batch_size or CONFIG["DB_BATCH_SIZE"]
+        self.flush_interval = flush_interval or CONFIG["DB_FLUSH_INTERVAL"]
         self._init_db()
 
+        # Rows are handed to a single writer thread that owns the connection,
+        # so callers on the event loop never wait for SQLite
+        self._pending = queue.Queue()
+        self._writer = threading.Thread(target=self._writer_loop, name="db-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.create_function("motd_hash", 1, motd_hash, deterministic=True)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
     def _init_db(self):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS servers (
-                    ip TEXT,
-                    port INTEGER,
-                    online INTEGER,
-                    max_online INTEGER,
-                    motd TEXT,
-                    version TEXT,
-                    cracked BOOLEAN,
-                    is_whitelisted BOOLEAN,
-                    plugins TEXT,
-                    last_checked TIMESTAMP,
-                    notes TEXT,
-                    PRIMARY KEY (ip, port)
-                )
-            ''')
-            conn.commit()
+        """Apply any migrations newer than the database's user_version"""
+        conn = self._connect()
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for target, script in enumerate(MIGRATIONS[version:], start=version + 1):
+                logging.info(f"Migrating {self.db_path} to schema version {target}...")
+                conn.executescript(f"BEGIN; {script}; PRAGMA user_version = {target}; COMMIT;")
+        finally:
+            conn.close()
 
     def save_server(self, data):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT OR REPLACE INTO servers 
-                (ip, port, online, max_online, motd, version, cracked, is_whitelisted, plugins, last_checked, notes)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                data['ip'], data['port'], data['online'], data['max_online'], 
-                data['motd'], data['version'], data.get('cracked'), 
-                data.get('is_whitelisted'), data.get('plugins'), datetime.now(), data.get('notes')
-            ))
-            conn.commit()
+        """Queue a server row for the writer thread, returns immediately"""
+        self._pending.put((
+            data['ip'], data['port'], data['online'], data['max_online'],
+            data['motd'], data['version'], data.get('cracked'),
+            data.get('is_whitelisted'), data.get('plugins'), datetime.now(), data.get('notes')
+        ))
+
+    def flush(self, timeout=None):
+        """Block until every row queued so far has been committed"""
+        done = threading.Event()
+        self._pending.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        if self._writer.is_alive():
+            self._pending.put(_STOP)
+            self._writer.join()
+
+    def find_servers_by_version(self, pattern):
+        """Servers whose version matches a GLOB pattern, e.g. '1.20*'"""
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute("SELECT * FROM servers WHERE version GLOB ?", (pattern,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_changed_since(self, since):
+        """
+        Observations at or after `since` where a server's version, player
+        counts or MOTD differ from its previous observation.
+        """
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute('''
+                SELECT * FROM (
+                    SELECT ip, port, observed_at, version, online, max_online, motd_hash,
+                        LAG(version) OVER w AS prev_version,
+                        LAG(online) OVER w AS prev_online,
+                        LAG(max_online) OVER w AS prev_max_online,
+                        LAG(motd_hash) OVER w AS prev_motd_hash,
+                        LAG(observed_at) OVER w AS prev_observed_at
+                    FROM observations
+                    WHERE (ip, port) IN (SELECT ip, port FROM observations WHERE observed_at >= ?)
+                    WINDOW w AS (PARTITION BY ip, port ORDER BY observed_at)
+                )
+                WHERE observed_at >= ? AND prev_observed_at IS NOT NULL AND (
+                    version IS NOT prev_version OR online IS NOT prev_online
+                    OR max_online IS NOT prev_max_online OR motd_hash IS NOT prev_motd_hash
+                )
+                ORDER BY observed_at
+            ''', (since, since)).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_stale_servers(self, before, limit=1000, after=None):
+        """
+        (ip, port, last_checked) of known servers last checked before `before`,
+        stalest first. Pass the last returned last_checked as `after` to page.
+        """
+        query = "SELECT ip, port, last_checked FROM servers WHERE last_checked < ?"
+        params = [before]
+        if after is not None:
+            query += " AND last_checked > ?"
+            params.append(after)
+        query += " ORDER BY last_checked LIMIT ?"
+        params.append(limit)
+        with self._connect() as conn:
+            return conn.execute(query, params).fetchall()
+
+    def get_last_checked(self, targets):
+        """Map (ip, port) -> last_checked for the given targets that are known"""
+        found = {}
+        with self._connect() as conn:
+            # Chunked to stay under SQLite's bound parameter limit
+            for i in range(0, len(targets), 400):
+                chunk = targets[i:i + 400]
+                placeholders = ",".join("(?, ?)" for _ in chunk)
+                params = [value for target in chunk for value in target]
+                rows = conn.execute(
+                    f"SELECT ip, port, last_checked FROM servers WHERE (ip, port) IN (VALUES {placeholders})",
+                    params
+                )
+                for ip, port, last_checked in rows:
+                    found[(ip, port)] = last_checked
+        return found
+
+    def _write_batch(self, conn, rows):
+        started = time.perf_counter()
+        try:
+            with conn:
+                conn.executemany('''
+                    INSERT OR REPLACE INTO servers
+                    (ip, port, online, max_online, motd, version, cracked, is_whitelisted, plugins, last_checked, notes)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', rows)
+                conn.executemany('''
+                    INSERT INTO observations (ip, port, observed_at, online, max_online, version, motd_hash)
+                    VALUES (?, ?, ?, ?, ?, ?, motd_hash(?))
+                ''', [(r[0], r[1], r[9], r[2], r[3], r[5], r[4]) for r in rows])
+            DB_ROWS_WRITTEN.inc(len(rows))
+        except Exception as e:
+            logging.error(f"Failed to write {len(rows)} servers to database: {e}")
+        DB_FLUSH_SECONDS.observe(time.perf_counter() - started)
+
+    def _writer_loop(self):
+        conn = self._connect()
+        rows = []
+        deadline = None
+        stopping = False
+        try:
+            while not stopping:
+                # Sleep until the next row arrives or the current batch is due
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    item = self._pending.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+
+                waiter = None
+                if item is _STOP:
+                    stopping = True
+                elif isinstance(item, threading.Event):
+                    waiter = item
+                elif item is not None:
+                    rows.append(item)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+
+                if rows and (stopping or waiter or len(rows) >= self.batch_size or time.monotonic() >= deadline):
+                    self._write_batch(conn, rows)
+                    rows = []
+                    deadline = None
+                if waiter:
+                    waiter.set()
+        finally:
+            if rows:
+                self._write_batch(conn, rows)
+            conn.close()
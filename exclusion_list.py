@@ -0,0 +1,188 @@
+import asyncio
+import bisect
+import ipaddress
+import logging
+import os
+import socket
+from typing import Optional
+from config import CONFIG
+from metrics import EXCLUDED_TARGETS
+
+
+def _ip_to_int(ip) -> Optional[int]:
+    """Integer key of an IP literal, IPv6 offset above the IPv4 space. None for hostnames"""
+    try:
+        return int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+    except (OSError, TypeError):
+        pass
+    try:
+        return (1 << 32) + int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), "big")
+    except (OSError, TypeError):
+        return None
+
+
+def _parse_entry(entry):
+    """(first, last) integer keys of an IP, CIDR or 'a-b' range, in masscan excludefile syntax"""
+    # Fast path for plain IPv4 addresses and prefixes, the bulk of any large list
+    address, _, prefix = entry.partition("/")
+    try:
+        first = int.from_bytes(socket.inet_pton(socket.AF_INET, address), "big")
+        bits = 32 - int(prefix) if prefix else 0
+    except (OSError, ValueError):
+        pass
+    else:
+        if 0 <= bits <= 32:
+            first &= ~((1 << bits) - 1) & 0xFFFFFFFF
+            return first, first | ((1 << bits) - 1)
+
+    if "-" in entry:
+        first, last = (ipaddress.ip_address(part.strip()) for part in entry.split("-", 1))
+        if first.version != last.version:
+            raise ValueError(f"Mixed IP versions in range {entry}")
+    else:
+        network = ipaddress.ip_network(entry, strict=False)
+        first, last = network.network_address, network.broadcast_address
+    offset = 0 if first.version == 4 else 1 << 32
+    return offset + int(first), offset + int(last)
+
+
+def _compile(intervals):
+    """Sort and merge overlapping/adjacent intervals into parallel start/end lists"""
+    starts, ends = [], []
+    for first, last in sorted(intervals):
+        if ends and first <= ends[-1] + 1:
+            ends[-1] = max(ends[-1], last)
+        else:
+            starts.append(first)
+            ends.append(last)
+    return starts, ends
+
+
+class ExclusionList:
+    """
+    Networks that must never be probed, compiled from an exclude file into
+    sorted, merged integer intervals so a lookup is one binary search.
+    The file uses masscan's excludefile syntax (IPs, CIDRs, 'a-b' ranges,
+    '#' comments) and is handed to masscan as is.
+    """
+    def __init__(self, path=None):
+        self.path = path if path is not None else CONFIG["EXCLUDE_FILE"]
+        # (starts, ends), replaced as one object so a reload in another thread is atomic
+        self._index = ([], [])
+        self._mtime = None
+        self.excluded = 0
+        if self.path:
+            self.reload()
+
+    def __len__(self):
+        return len(self._index[0])
+
+    @property
+    def masscan_path(self) -> Optional[str]:
+        """Absolute path for --excludefile (masscan runs in its own work dir)"""
+        return os.path.abspath(self.path) if self.path and os.path.exists(self.path) else None
+
+    def _load(self):
+        intervals = []
+        with open(self.path, "r") as f:
+            for line_no, line in enumerate(f, start=1):
+                line = line.split("#", 1)[0]
+                for entry in line.replace(",", " ").split():
+                    try:
+                        intervals.append(_parse_entry(entry))
+                    except ValueError as e:
+                        logging.warning(f"{self.path}:{line_no}: skipping invalid exclusion '{entry}': {e}")
+        return _compile(intervals)
+
+    def reload(self):
+        """Recompile from the file, keeps the current set if the file is missing or unreadable"""
+        try:
+            mtime = os.path.getmtime(self.path)
+            starts, ends = self._load()
+        except OSError as e:
+            logging.error(f"Could not load exclusion list {self.path}: {e}")
+            return False
+        self._index = (starts, ends)
+        self._mtime = mtime
+        logging.info(f"Loaded {len(starts)} excluded ranges from {self.path}.")
+        return True
+
+    def changed(self) -> bool:
+        try:
+            return os.path.getmtime(self.path) != self._mtime
+        except OSError:
+            return False
+
+    async def watch(self, interval=None):
+        """Reload in a worker thread whenever the file's mtime changes"""
+        if not self.path:
+            return
+        interval = interval or CONFIG["EXCLUDE_RELOAD_INTERVAL"]
+        while True:
+            await asyncio.sleep(interval)
+            if self.changed():
+                await asyncio.to_thread(self.reload)
+
+    def contains_key(self, key: int) -> bool:
+        starts, ends = self._index
+        i = bisect.bisect_right(starts, key) - 1
+        return i >= 0 and key <= ends[i]
+
+    def contains(self, ip: str) -> bool:
+        """True for IP literals inside an excluded range, hostnames are never matched here"""
+        if not self._index[0]:
+            return False
+        key = _ip_to_int(ip)
+        return key is not None and self.contains_key(key)
+
+    def filter(self, targets: list[dict]) -> list[dict]:
+        """Drop targets whose IP is excluded"""
+        if not self._index[0] or not targets:
+            return targets
+        allowed = [target for target in targets if not self.contains(target["ip"])]
+        dropped = len(targets) - len(allowed)
+        if dropped:
+            self.excluded += dropped
+            EXCLUDED_TARGETS.inc(dropped)
+        return allowed
+
+    async def resolves_to_excluded(self, host: str, port: int = 25565) -> bool:
+        """Resolve a hostname and check every address it points to"""
+        if not self._index[0]:
+            return False
+        if _ip_to_int(host) is not None:
+            return self.contains(host)
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        except OSError:
+            return False
+        return any(self.contains(info[4][0]) for info in infos)
+
+    async def filter_resolved(self, targets: list[dict], concurrency=50) -> list[dict]:
+        """Like filter(), but also resolves hostnames (e.g. scraped servers) to check them"""
+        if not self._index[0] or not targets:
+            return targets
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def allowed(target):
+            async with semaphore:
+                return not await self.resolves_to_excluded(target["ip"], target["port"])
+
+        verdicts = await asyncio.gather(*(allowed(target) for target in targets))
+        kept = [target for target, ok in zip(targets, verdicts) if ok]
+        dropped = len(targets) - len(kept)
+        if dropped:
+            self.excluded += dropped
+            EXCLUDED_TARGETS.inc(dropped)
+        return kept
+
+
+_default = None
+
+
+def default_exclusions() -> ExclusionList:
+    """Process-wide exclusion list from CONFIG["EXCLUDE_FILE"], loaded on first use"""
+    global _default
+    if _default is None:
+        _default = ExclusionList()
+    return _default
@@ -2,43 +2,158 @@ import sqlite3
 import csv
 import json
 import logging
+import argparse
+from contextlib import closing
 from datetime import datetime
 
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
 class DataExporter:
-    def __init__(self, db_path="servers.db"):
+    def __init__(self, db_path="servers.db", chunk_size=5000):
         self.db_path = db_path
+        self.chunk_size = chunk_size
+
+    def _iter_chunks(self, since=None):
+        """
+        Yield (columns, rows) chunks of exportable servers straight from the
+        cursor. With `since`, only servers checked after that time are
+        returned, oldest first, using the (is_whitelisted, last_checked) index.
+        """
+        query = "SELECT * FROM servers WHERE is_whitelisted = 0"
+        params = ()
+        if since is not None:
+            query += " AND last_checked > ? ORDER BY last_checked"
+            params = (since,)
 
-    def _fetch_all(self):
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                cursor.execute("SELECT * FROM servers WHERE is_whitelisted = 0")
-                return [dict(row) for row in cursor.fetchall()]
+            with closing(sqlite3.connect(self.db_path)) as conn:
+                cursor = conn.execute(query, params)
+                columns = [col[0] for col in cursor.description]
+                rows = cursor.fetchmany(self.chunk_size)
+                # Always yield once, so an export without matches still gets its CSV header
+                yield columns, rows
+                while rows:
+                    rows = cursor.fetchmany(self.chunk_size)
+                    if rows:
+                        yield columns, rows
         except Exception as e:
             logging.error(f"Error fetching data for export: {e}")
-            return []
-
-    def export_csv(self, filename="discovered_servers.csv"):
-        data = self._fetch_all()
-        if not data:
-            return
-        
-        keys = data[0].keys()
+
+    def _iter_rows(self, since=None):
+        for columns, rows in self._iter_chunks(since):
+            for row in rows:
+                yield dict(zip(columns, row))
+
+    def export_csv(self, filename="discovered_servers.csv", since=None):
+        count = 0
         try:
             with open(filename, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=keys)
-                writer.writeheader()
-                writer.writerows(data)
-            logging.info(f"Exported {len(data)} servers to {filename}")
+                writer = None
+                for columns, rows in self._iter_chunks(since):
+                    if writer is None:
+                        writer = csv.writer(f)
+                        writer.writerow(columns)
+                    writer.writerows(rows)
+                    count += len(rows)
+            logging.info(f"Exported {count} servers to {filename}")
         except Exception as e:
             logging.error(f"CSV Export error: {e}")
+        return count
 
-    def export_json(self, filename="discovered_servers.json"):
-        data = self._fetch_all()
+    def export_json(self, filename="discovered_servers.json", since=None):
+        count = 0
         try:
             with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=4, default=str)
-            logging.info(f"Exported {len(data)} servers to {filename}")
+                f.write("[")
+                for row in self._iter_rows(since):
+                    f.write(",\n" if count else "\n")
+                    f.write(json.dumps(row, default=str))
+                    count += 1
+                f.write("\n]\n")
+            logging.info(f"Exported {count} servers to {filename}")
         except Exception as e:
             logging.error(f"JSON Export error: {e}")
+        return count
+
+    def export_ndjson(self, filename="discovered_servers.ndjson", since=None):
+        """One JSON object per line, can be appended to and read incrementally"""
+        count = 0
+        try:
+            with open(filename, 'w', encoding='utf-8') as f:
+                for row in self._iter_rows(since):
+                    f.write(json.dumps(row, default=str))
+                    f.write("\n")
+                    count += 1
+            logging.info(f"Exported {count} servers to {filename}")
+        except Exception as e:
+            logging.error(f"NDJSON Export error: {e}")
+        return count
+
+    def export_parquet(self, filename="discovered_servers.parquet", since=None):
+        """Columnar export, requires the optional pyarrow dependency"""
+        if pa is None:
+            logging.error("Parquet export requires pyarrow (pip install pyarrow)")
+            return 0
+
+        schema = pa.schema([
+            ("ip", pa.string()),
+            ("port", pa.int32()),
+            ("online", pa.int32()),
+            ("max_online", pa.int32()),
+            ("motd", pa.string()),
+            ("version", pa.string()),
+            ("cracked", pa.bool_()),
+            ("is_whitelisted", pa.bool_()),
+            ("plugins", pa.string()),
+            ("last_checked", pa.timestamp("us")),
+            ("notes", pa.string()),
+        ])
+        converters = {
+            "cracked": lambda v: None if v is None else bool(v),
+            "is_whitelisted": lambda v: None if v is None else bool(v),
+            "last_checked": lambda v: datetime.fromisoformat(v) if isinstance(v, str) else v,
+        }
+
+        count = 0
+        try:
+            with pq.ParquetWriter(filename, schema) as writer:
+                for columns, rows in self._iter_chunks(since):
+                    arrays = []
+                    for field in schema:
+                        idx = columns.index(field.name)
+                        convert = converters.get(field.name)
+                        values = [row[idx] for row in rows]
+                        if convert:
+                            values = [convert(v) for v in values]
+                        arrays.append(pa.array(values, type=field.type))
+                    writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+                    count += len(rows)
+            logging.info(f"Exported {count} servers to {filename}")
+        except Exception as e:
+            logging.error(f"Parquet Export error: {e}")
+        return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export discovered servers from servers.db")
+    parser.add_argument("--format", choices=["csv", "json", "ndjson", "parquet"], default="csv")
+    parser.add_argument("--output", help="Output file (default: discovered_servers.<format>)")
+    parser.add_argument("--since", help="Only export servers checked after this time (e.g., '2026-01-31 00:00:00')")
+    parser.add_argument("--db", default="servers.db", help="Path to the SQLite database")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(levelname)s | %(message)s')
+    exporter = DataExporter(db_path=args.db)
+    export = getattr(exporter, f"export_{args.format}")
+    if args.output:
+        export(args.output, since=args.since)
+    else:
+        export(since=args.since)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import NamedTuple, Optional
+from config import CONFIG
+
+
+class CacheEntry(NamedTuple):
+    url: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+    servers: list
+
+
+class HttpCache:
+    """
+    On-disk cache of listing pages keyed by URL. Stores the response
+    validators (ETag / Last-Modified) with the page's parse results, so a
+    304 revalidation or a still-fresh entry skips downloading and parsing.
+    """
+    def __init__(self, cache_dir=None, max_age=None):
+        self.cache_dir = cache_dir or CONFIG["SCRAPER_CACHE_DIR"]
+        self.max_age = CONFIG["SCRAPER_CACHE_MAX_AGE"] if max_age is None else max_age
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, url) -> Optional[CacheEntry]:
+        try:
+            with open(self._path(url), "r", encoding="utf-8") as f:
+                entry = CacheEntry(**json.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, TypeError) as e:
+            logging.warning(f"Ignoring unreadable cache entry for {url}: {e}")
+            return None
+        return entry if entry.url == url else None
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        """True while the entry is younger than max_age and can be used without a request"""
+        return time.time() - entry.fetched_at < self.max_age
+
+    @staticmethod
+    def conditional_headers(entry: Optional[CacheEntry]) -> dict:
+        headers = {}
+        if entry is None:
+            return headers
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def put(self, url, etag, last_modified, servers) -> Optional[CacheEntry]:
+        """Store a page's parse results. Without validators or a max-age there is nothing to reuse, so skip it"""
+        if not etag and not last_modified and self.max_age <= 0:
+            return None
+        entry = CacheEntry(url, etag, last_modified, time.time(), servers)
+        path = self._path(url)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry._asdict(), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"Failed to write cache entry for {url}: {e}")
+        return entry
+
+    def touch(self, entry: CacheEntry) -> CacheEntry:
+        """Restart an entry's max-age after the server confirmed it (304)"""
+        return self.put(entry.url, entry.etag, entry.last_modified, entry.servers) or entry
@@ -0,0 +1,34 @@
+import asyncio
+import logging
+from config import CONFIG
+from metrics import LOOP_LAG
+
+class LoopLagMonitor:
+    """
+    Measures how late a periodic sleep wakes up, which is how long the event
+    loop was blocked by synchronous work, and warns above a threshold.
+    """
+    def __init__(self, interval=None, threshold=None):
+        self.interval = interval or CONFIG["LOOP_LAG_INTERVAL"]
+        self.threshold = threshold or CONFIG["LOOP_LAG_THRESHOLD"]
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+
+    def reset_max(self):
+        """Return the worst lag seen since the last call and start over"""
+        worst, self.max_lag = self.max_lag, 0.0
+        return worst
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            LOOP_LAG.observe(lag)
+            if lag > self.threshold:
+                self.stalls += 1
+                logging.warning(f"Event loop was blocked for {lag * 1000:.0f} ms")
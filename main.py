@@ -2,12 +2,8 @@ import asyncio
 import logging
 import sys
 import argparse
-from datetime import datetime
-from db_handler import DatabaseHandler
-from scraper import ServerScraper
-from masscan_wrapper import MasscanWrapper
-from mcstatus_scanner import MCStatusScanner
-from whitelist_detector import WhitelistDetector
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from config import CONFIG
 
 logging.basicConfig(
@@ -17,50 +13,143 @@ logging.basicConfig(
 )
 
 from queue_manager import TaskQueue
+from loop_monitor import LoopLagMonitor
 from notifier import WebhookNotifier
+from exclusion_list import default_exclusions
+from masscan_wrapper import parse_shard
+import metrics
 from colorama import Fore, Style, init
 
 init(autoreset=True)
 
-from proxy_manager import ProxyManager
-
 class MCDiscoveryAgent:
-    def __init__(self, use_proxies=True):
-        self.db = DatabaseHandler()
+    """
+    Subsystems a mode doesn't use are never built: the database, scraper,
+    masscan, ping scanner, whitelist checker and recheck scheduler are
+    created (and their heavy dependencies imported) on first use.
+    """
+    def __init__(self, use_proxies=True, shard=None):
+        self.exclusions = default_exclusions()
         self.use_proxies = use_proxies
-        self.proxy_manager = ProxyManager(CONFIG["PROXY_LIST"], skip_fetch=not use_proxies) if use_proxies else None
-        self.scraper = ServerScraper(proxy_manager=self.proxy_manager)
-        self.masscan = MasscanWrapper()
-        self.mc_scanner = MCStatusScanner()
-        self.whitelist_checker = WhitelistDetector()
+        # Masscan is built lazily, reject a bad shard (or MASSCAN_SHARD) before anything starts
+        parse_shard(shard or CONFIG["MASSCAN_SHARD"])
+        self.shard = shard
         self.queue = TaskQueue(
             use_redis=CONFIG["USE_REDIS"], 
             host=CONFIG["REDIS_HOST"], 
             port=CONFIG["REDIS_PORT"]
         )
         self.notifier = WebhookNotifier()
+        self._db = None
+        self._scraper = None
+        self._masscan = None
+        self._mc_scanner = None
+        self._whitelist_checker = None
+        self._recheck = None
         self.semaphore = asyncio.Semaphore(CONFIG["CONCURRENCY_LIMIT"])
+        # Synchronous libraries (requests/BeautifulSoup, ...) run here, never on the event loop
+        self.executor = ThreadPoolExecutor(max_workers=CONFIG["BLOCKING_POOL_SIZE"], thread_name_prefix="blocking")
+        self.loop_monitor = LoopLagMonitor()
+        self.metrics_summary = metrics.DashboardSummary()
+        metrics.add_collector(self.collect_metrics)
         self.total_found = 0
         self.start_time = datetime.now()
 
+    async def run_blocking(self, func, *args):
+        """Run a blocking call in the executor and await its result"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def get_scraper(self):
+        if self._scraper is None:
+            proxy_manager = None
+            if self.use_proxies:
+                from proxy_manager import ProxyManager
+                # Fetches from the proxy API and rewrites the proxy file, keep it off the loop
+                proxy_manager = await self.run_blocking(ProxyManager, CONFIG["PROXY_LIST"])
+            from scraper import ServerScraper
+            self._scraper = ServerScraper(proxy_manager=proxy_manager)
+        return self._scraper
+
+    @property
+    def db(self):
+        if self._db is None:
+            # Migrates the schema and starts the writer thread, ping nodes never need it
+            from db_handler import DatabaseHandler
+            self._db = DatabaseHandler()
+        return self._db
+
+    @property
+    def masscan(self):
+        if self._masscan is None:
+            from masscan_wrapper import MasscanWrapper
+            self._masscan = MasscanWrapper(shard=self.shard)
+        return self._masscan
+
+    @property
+    def mc_scanner(self):
+        if self._mc_scanner is None:
+            from mcstatus_scanner import MCStatusScanner
+            self._mc_scanner = MCStatusScanner()
+        return self._mc_scanner
+
+    @property
+    def whitelist_checker(self):
+        if self._whitelist_checker is None:
+            from whitelist_detector import WhitelistDetector
+            self._whitelist_checker = WhitelistDetector()
+        return self._whitelist_checker
+
+    @property
+    def recheck(self):
+        if self._recheck is None:
+            from recheck_scheduler import RecheckScheduler
+            self._recheck = RecheckScheduler(self.db, self.queue)
+        return self._recheck
+
+    def mark_checked(self, targets):
+        """Stamp targets as checked for the recheck TTL, if this node filters by it"""
+        # Ping and worker nodes don't filter hits, and shouldn't open the database for this
+        if self._recheck:
+            self._recheck.mark_checked(targets)
+
+    async def collect_metrics(self):
+        for stage, size in (await self.queue.get_stage_sizes()).items():
+            metrics.QUEUE_DEPTH.set(size, stage=stage)
+
     async def report_stats(self):
         """Periodically report scanning statistics"""
         while True:
-            q_size = await self.queue.get_queue_size()
+            stage_sizes = await self.queue.get_stage_sizes()
+            for stage, size in stage_sizes.items():
+                metrics.QUEUE_DEPTH.set(size, stage=stage)
             uptime = datetime.now() - self.start_time
             logging.info(f"{Fore.BLUE}{Style.BRIGHT}--- DASHBOARD ---")
-            logging.info(f"Uptime: {uptime} | Queue Size: {q_size} | Total Prime Targets: {self.total_found}")
+            logging.info(f"Uptime: {uptime} | Queue Size: {sum(stage_sizes.values())} | Total Prime Targets: {self.total_found}")
+            if self._recheck:
+                logging.info(f"Recently Checked (skipped): {self._recheck.skipped}")
+            logging.info(f"Loop Lag (max last period): {self.loop_monitor.reset_max() * 1000:.0f} ms | Stalls: {self.loop_monitor.stalls}")
+            logging.info("Stage Backlog: " + " | ".join(
+                f"{stage}: {size}" + (" (PAUSED)" if self.queue.paused.get(stage) else "")
+                for stage, size in stage_sizes.items()
+            ))
+            status = self._masscan.last_status if self._masscan else None
+            if status:
+                eta = timedelta(seconds=status.eta_seconds) if status.eta_seconds is not None else "n/a"
+                logging.info(f"Masscan: {status.kpps:.2f} kpps | {status.percent_done:.2f}% done | ETA: {eta} | Hits: {status.hits}")
+            for line in self.metrics_summary.lines():
+                logging.info(line)
             logging.info(f"{Fore.BLUE}{Style.BRIGHT}-----------------")
             await asyncio.sleep(60)
 
     async def process_potential_server(self, server_data):
-        """Deep check and save if promising"""
+        """Deep check and hand prime targets to the 'enriched' stage"""
         async with self.semaphore:
             ip = server_data['ip']
             port = server_data['port']
             
             logging.info(f"{Fore.CYAN}Deep checking {ip}:{port}...")
-            check_result = self.whitelist_checker.check_server(ip, port)
+            self.mark_checked([server_data])
+            check_result = await self.whitelist_checker.async_check_server(ip, port)
             
             if check_result['status'] == 'success':
                 self.total_found += 1
@@ -70,8 +159,8 @@ class MCDiscoveryAgent:
                 server_data['notes'] = f"Join Success: Likely cracked/no-whitelist. Plugins: {server_data['plugins']}"
                 logging.info(f"{Fore.GREEN}{Style.BRIGHT}PRIME TARGET: {ip}:{port} | {server_data['online']}/{server_data['max_online']} | Plugins: {server_data['plugins']}")
                 
-                self.db.save_server(server_data)
-                await self.notifier.notify_discovery(server_data)
+                await self.queue.wait_for_capacity("enriched")
+                await self.queue.enqueue_batch([server_data], stage="enriched")
                 
             elif check_result['status'] == 'whitelisted':
                 logging.debug(f"Server {ip}:{port} is whitelisted.")
@@ -79,19 +168,18 @@ class MCDiscoveryAgent:
                 logging.debug(f"Server {ip}:{port} check result: {check_result['status']}")
 
     async def worker(self):
-        """Worker loop to process tasks from Redis with health monitoring"""
+        """Worker loop to deep check pinged servers from the queue with health monitoring"""
         worker_id = f"worker_{id(self)}_{asyncio.current_task().get_name()}"
         logging.info(f"{Fore.YELLOW}Worker {worker_id} started. Waiting for tasks...")
         
         consecutive_errors = 0
         while True:
             try:
-                task = await self.queue.dequeue()
+                # Blocks until a task arrives (or the dequeue timeout passes)
+                task = await self.queue.dequeue("pinged")
                 if task:
                     await self.process_potential_server(task)
                     consecutive_errors = 0  # Reset on success
-                else:
-                    await asyncio.sleep(5)
             except Exception as e:
                 consecutive_errors += 1
                 logging.error(f"{Fore.RED}Worker {worker_id} error ({consecutive_errors}): {e}")
@@ -105,66 +193,133 @@ class MCDiscoveryAgent:
     async def run_discovery_cycle(self, ip_ranges=None):
         # 1. Scrape known lists
         logging.info(f"{Fore.MAGENTA}Starting scraper...")
-        scraped_servers = self.scraper.scrape_all()
-        if scraped_servers:
-            await self.queue.enqueue_batch(scraped_servers)
-        
+        scraper = await self.get_scraper()
+        try:
+            # Pages are enqueued as they arrive, listings already report player
+            # counts so they skip the ping stage
+            async for servers in scraper.iter_servers():
+                # Listings mostly give hostnames, resolve them to check the exclusion list
+                servers = await self.exclusions.filter_resolved(servers)
+                scraped_servers = await self.recheck.filter_unchecked(servers)
+                if scraped_servers:
+                    await self.queue.wait_for_capacity("pinged")
+                    await self.queue.enqueue_batch(scraped_servers, stage="pinged", dedup=True)
+        finally:
+            await scraper.close()
+
         # 2. Run masscan if ranges provided
         if ip_ranges:
             for ip_range in ip_ranges:
+                if CONFIG["MASSCAN_STREAM"]:
+                    # Enqueue hits in small batches while masscan is still running. While
+                    # raw is over its high watermark, hits accumulate in the wrapper's spill
+                    async for hits in self.masscan.stream_range(ip_range):
+                        tasks = await self.recheck.filter_unchecked([{"ip": ip, "port": port} for ip, port in hits])
+                        await self.queue.wait_for_capacity("raw")
+                        await self.queue.enqueue_batch(tasks, stage="raw")
+                    continue
+
                 discovered = await self.masscan.scan_range(ip_range)
                 # Convert to dict format for queue
-                tasks = [{"ip": ip, "port": port} for ip, port in discovered]
-                await self.queue.enqueue_batch(tasks)
+                tasks = await self.recheck.filter_unchecked([{"ip": ip, "port": port} for ip, port in discovered])
+                await self.queue.wait_for_capacity("raw")
+                await self.queue.enqueue_batch(tasks, stage="raw")
 
     async def ping_and_filter(self):
-        """Intermediate step: take raw IP:port from queue, ping it, and re-queue if promising"""
+        """
+        Ping stage: keep up to PING_CONCURRENCY probes in flight on raw IP:port
+        hits and pass promising servers to the 'pinged' stage
+        """
+        from ping_workers import enqueue_pinged, iter_stage, ping_stage
+        concurrency = CONFIG["PING_CONCURRENCY"]
+
+        async def targets():
+            async for ip, port in iter_stage(self.queue, "raw", concurrency):
+                self.mark_checked([{"ip": ip, "port": port}])
+                yield ip, port
+
+        await ping_stage(
+            self.mc_scanner,
+            targets(),
+            concurrency,
+            lambda res: enqueue_pinged(self.queue, res)
+        )
+
+    async def persist_results(self):
+        """Final stage: save deep-checked prime targets and announce the ones not seen before"""
         while True:
-            task = await self.queue.dequeue()
-            if not task:
-                await asyncio.sleep(5)
-                continue
-                
-            # If it already has online info, it's ready for deep check
-            if 'online' in task:
-                await self.process_potential_server(task)
+            server_data = await self.queue.dequeue("enriched")
+            if not server_data:
                 continue
-
-            # Otherwise, it's a raw IP:port from masscan
-            res = await self.mc_scanner.scan_server(task['ip'], task['port'])
-            if res and res['online'] <= CONFIG["TARGET_PLAYER_MAX"] and res['max_online'] <= CONFIG["SERVER_PLAYER_CAP"]:
-                await self.queue.enqueue_batch([res])
+            try:
+                # Rechecks and rediscoveries of known servers end up here too, only announce new ones
+                known = await self.run_blocking(self.db.get_last_checked, [(server_data['ip'], server_data['port'])])
+                self.db.save_server(server_data)
+                if not known:
+                    self.notifier.notify_discovery(server_data)
+            except Exception as e:
+                logging.error(f"{Fore.RED}Failed to persist {server_data['ip']}:{server_data['port']}: {e}")
 
 import argparse
 
+def shard_arg(value):
+    """argparse type for --shard, keeps the 'i/N' string once it parses"""
+    try:
+        parse_shard(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return value
+
 async def main():
     parser = argparse.ArgumentParser(description="MCScanner - Minecraft Server Discovery Agent")
-    parser.add_argument("--mode", choices=["discovery", "worker", "full"], default="full", 
-                        help="discovery: scrape/scan and enqueue; worker: process queue; full: do both")
+    parser.add_argument("--mode", choices=["discovery", "ping", "worker", "full"], default="full",
+                        help="discovery: scrape/scan, enqueue and ping; ping: only run the ping stage; "
+                             "worker: deep check pinged servers; full: do everything")
     parser.add_argument("--range", help="IPv4 range for masscan (e.g., 1.2.3.0/24)")
+    parser.add_argument("--shard", type=shard_arg, help="Scan only shard i of N of the range (e.g., 2/4), for splitting a sweep across nodes")
     parser.add_argument("--workers", type=int, default=1, help="Number of worker tasks to spawn in worker/full mode")
+    parser.add_argument("--processes", type=int, default=0,
+                        help="Run the ping stage in N separate worker processes instead of the main event loop")
     parser.add_argument("--no-proxy", action="store_true", help="Disable proxy usage for scraping")
     
     args = parser.parse_args()
-    agent = MCDiscoveryAgent(use_proxies=not args.no_proxy)
+    agent = MCDiscoveryAgent(use_proxies=not args.no_proxy, shard=args.shard)
+    # asyncio.to_thread in the subsystems (database lookups, scraper cache, exclusion reloads) uses this pool too
+    asyncio.get_running_loop().set_default_executor(agent.executor)
+
+    def start_ping_stage():
+        if args.processes > 0:
+            from ping_workers import PingWorkerPool
+            return PingWorkerPool(agent.queue, args.processes, on_dispatch=agent.mark_checked).run()
+        return agent.ping_and_filter()
 
     tasks = []
-    
+
     if args.mode in ["discovery", "full"]:
         ip_ranges = [args.range] if args.range else None
         tasks.append(agent.run_discovery_cycle(ip_ranges))
-        tasks.append(agent.ping_and_filter())
+        tasks.append(agent.recheck.run())
+        tasks.append(start_ping_stage())
+        tasks.append(agent.report_stats())
+
+    if args.mode == "ping":
+        tasks.append(start_ping_stage())
         tasks.append(agent.report_stats())
 
     if args.mode in ["worker", "full"]:
         for _ in range(args.workers):
             tasks.append(agent.worker())
+        tasks.append(agent.persist_results())
+        tasks.append(agent.notifier.run())
         if args.mode == "worker":
             tasks.append(agent.report_stats())
 
     if not tasks:
         parser.print_help()
         return
+    tasks.append(agent.loop_monitor.run())
+    tasks.append(agent.exclusions.watch())
+    tasks.append(metrics.serve())
 
     logging.info(f"{Fore.BLUE}{Style.BRIGHT}MCScanner started in '{args.mode}' mode with {args.workers} worker(s).")
     await asyncio.gather(*tasks)
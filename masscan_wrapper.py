@@ -3,40 +3,154 @@ import json
 import os
 import logging
 import asyncio
+import glob
+import re
+import shutil
+import signal
+from collections import deque
+from typing import NamedTuple, Optional
 from config import CONFIG
+from metrics import MASSCAN_HITS
+from exclusion_list import ExclusionList, default_exclusions
+
+# Masscan status lines look like:
+# rate:  0.90-kpps,  8.36% done,   0:16:42 remaining, found=26
+_LINE_SPLIT_RE = re.compile(rb"[\r\n]")
+_RATE_RE = re.compile(r"rate:\s*([\d.]+)-kpps")
+_PERCENT_RE = re.compile(r"([\d.]+)% done")
+_REMAINING_RE = re.compile(r"(?:(\d+)-days?,?\s*)?(\d+):(\d{2}):(\d{2}) remaining")
+_FOUND_RE = re.compile(r"found=(\d+)|(\d+) hits")
+
+RESUME_FILE = "paused.conf"
+OUTPUT_FILE = "masscan_out.json"
+SPILL_FILE = "spill.txt"
+
+
+class MasscanStatus(NamedTuple):
+    kpps: float
+    percent_done: float
+    eta_seconds: Optional[int]
+    hits: int
+    line: str
+
+
+class HitSpill:
+    """
+    Hits read from masscan but not yet taken by the consumer. The first
+    memory_limit hits are kept in memory, the rest are appended to a file
+    and read back once memory drains, so a slow consumer never loses hits.
+    """
+    def __init__(self, path, memory_limit):
+        self.path = path
+        self.memory_limit = memory_limit
+        self.memory = deque()
+        self.on_disk = 0
+        self._writer = None
+        self._reader = None
+
+    def __len__(self):
+        return len(self.memory) + self.on_disk
+
+    def put(self, hit):
+        if len(self.memory) < self.memory_limit and not self.on_disk:
+            self.memory.append(hit)
+            return
+        if self._writer is None:
+            self._writer = open(self.path, "w")
+            self._reader = open(self.path, "r")
+        self._writer.write(f"{hit[0]} {hit[1]}\n")
+        self.on_disk += 1
+
+    def take(self, count):
+        """Up to `count` hits, oldest first"""
+        if not self.memory and self.on_disk:
+            self._writer.flush()
+            for _ in range(min(self.on_disk, self.memory_limit)):
+                ip, port = self._reader.readline().split()
+                self.memory.append((ip, int(port)))
+                self.on_disk -= 1
+            if not self.on_disk:
+                # Start a fresh file next time instead of growing this one
+                self.close()
+        return [self.memory.popleft() for _ in range(min(count, len(self.memory)))]
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._reader.close()
+            self._writer = self._reader = None
+            os.remove(self.path)
+
+
+def parse_shard(value):
+    """Parse an 'i/N' shard spec into (i, N)"""
+    try:
+        index, total = (int(x) for x in value.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{value}', expected i/N")
+    if not 1 <= index <= total:
+        raise ValueError(f"Invalid shard '{value}', index must be between 1 and {total}")
+    return index, total
+
 
 class MasscanWrapper:
-    def __init__(self):
-        self.masscan_path = CONFIG["MASSCAN_PATH"]
+    def __init__(self, shard=None, exclusions: ExclusionList = None):
+        # masscan runs inside per-shard directories, so resolve relative paths now
+        self.masscan_path = shutil.which(CONFIG["MASSCAN_PATH"]) or os.path.abspath(CONFIG["MASSCAN_PATH"])
         self.rate = CONFIG["SCAN_RATE"]
-        self.last_status = {}
+        # Every node of a sharded sweep must use the same seed to get disjoint shards
+        self.shard = parse_shard(shard or CONFIG["MASSCAN_SHARD"])
+        self.seed = CONFIG["MASSCAN_SEED"]
+        self.work_dir = CONFIG["MASSCAN_WORK_DIR"]
+        self.exclusions = exclusions or default_exclusions()
+        self.last_status: Optional[MasscanStatus] = None
         self.status_task = None
 
+    @staticmethod
+    def parse_status_line(line):
+        """Parse a masscan --status line into a MasscanStatus, or None if it isn't one"""
+        rate = _RATE_RE.search(line)
+        percent = _PERCENT_RE.search(line)
+        if not rate and not percent:
+            return None
+
+        eta = None
+        remaining = _REMAINING_RE.search(line)
+        if remaining:
+            days = int(remaining.group(1) or 0)
+            eta = days * 86400 + int(remaining.group(2)) * 3600 + int(remaining.group(3)) * 60 + int(remaining.group(4))
+
+        hits = _FOUND_RE.search(line)
+        return MasscanStatus(
+            kpps=float(rate.group(1)) if rate else 0.0,
+            percent_done=float(percent.group(1)) if percent else 0.0,
+            eta_seconds=eta,
+            hits=int(hits.group(1) or hits.group(2)) if hits else 0,
+            line=line
+        )
+
     async def _monitor_masscan(self, process):
         """Read masscan stderr and log status every 30 seconds"""
         async def read_stderr():
             try:
-                buffer = b""
+                pending = b""
                 while True:
-                    char = await process.stderr.read(1)
-                    if not char:
+                    chunk = await process.stderr.read(4096)
+                    if not chunk:
                         break
-                    
-                    if char in (b'\r', b'\n'):
-                        line = buffer.decode('utf-8', errors='ignore').strip()
-                        buffer = b""
+
+                    # Status updates are terminated by \r, regular messages by \n
+                    *lines, pending = _LINE_SPLIT_RE.split(pending + chunk)
+                    for raw in lines:
+                        line = raw.decode('utf-8', errors='ignore').strip()
                         if not line:
                             continue
-                        
-                        # Log every distinct line for debugging
-                        logging.debug(f"[MASSCAN-STDERR] {line}")
-                        
-                        # Masscan status lines often look like:
-                        # rate: 100.00-kpps, 1.23% done, 0:01:23 remaining, 123 hits
-                        if any(key in line.lower() for key in ["rate:", "done", "remaining", "hits:"]):
-                            self.last_status["latest"] = line
-                    else:
-                        buffer += char
+
+                        status = self.parse_status_line(line)
+                        if status:
+                            self.last_status = status
+                        else:
+                            logging.debug(f"[MASSCAN-STDERR] {line}")
             except Exception as e:
                 logging.debug(f"Error reading masscan stderr: {e}")
 
@@ -49,15 +163,15 @@ class MasscanWrapper:
                 if reader_task.done():
                     break
                 await asyncio.sleep(1)
-                if "latest" in self.last_status:
-                    logging.info(f"[MASSCAN] {self.last_status['latest']}")
+                if self.last_status:
+                    logging.info(f"[MASSCAN] {self.last_status.line}")
                     break
             
             # Then continue with the 30s reporting loop
             while not reader_task.done():
                 await asyncio.sleep(30)
-                if "latest" in self.last_status:
-                    logging.info(f"[MASSCAN] {self.last_status['latest']}")
+                if self.last_status:
+                    logging.info(f"[MASSCAN] {self.last_status.line}")
         except asyncio.CancelledError:
             reader_task.cancel()
             raise
@@ -65,37 +179,82 @@ class MasscanWrapper:
             if not reader_task.done():
                 reader_task.cancel()
 
-    async def scan_range(self, ip_range, port="25565"):
+    @staticmethod
+    def _parse_list_line(line):
+        """Parse a masscan -oL line: 'open tcp 25565 1.2.3.4 1770984963'"""
+        parts = line.split()
+        if len(parts) < 4 or parts[0] != "open":
+            return None
+        try:
+            return parts[3], int(parts[2])
+        except ValueError:
+            return None
+
+    def _run_dir(self, ip_range, port):
+        """Per range/port/shard working directory, holds paused.conf and output files"""
+        name = re.sub(r"[^0-9A-Za-z.-]+", "_", f"{ip_range}_p{port}")
+        run_dir = os.path.join(self.work_dir, f"{name}_shard{self.shard[0]}of{self.shard[1]}")
+        os.makedirs(run_dir, exist_ok=True)
+        return run_dir
+
+    def _build_cmd(self, ip_range, port, run_dir, output_args):
         """
-        Runs masscan on a given IP range.
-        Output is parsed from JSON.
+        Build the masscan command line. If a previous run of this shard was
+        interrupted, masscan left a paused.conf in run_dir and we resume from it.
         """
-        output_file = "masscan_out.json"
-        cmd = [
+        # Passed on resume too, so ranges excluded since the pause are honoured
+        exclude_args = ["--excludefile", self.exclusions.masscan_path] if self.exclusions.masscan_path else []
+        if os.path.exists(os.path.join(run_dir, RESUME_FILE)):
+            logging.info(f"Resuming masscan on {ip_range} (shard {self.shard[0]}/{self.shard[1]}) from {RESUME_FILE}")
+            return [self.masscan_path, "--resume", RESUME_FILE, *exclude_args, *output_args, "--wait", "0", "--status"]
+
+        return [
             self.masscan_path,
             ip_range,
             "-p", port,
             "--max-rate", str(self.rate),
-            "-oJ", output_file,
+            "--shards", f"{self.shard[0]}/{self.shard[1]}",
+            "--seed", str(self.seed),
+            *exclude_args,
+            *output_args,
             "--wait", "0",
             "--status"
         ]
-        
+
+    async def _start(self, ip_range, port, run_dir, output_args):
+        cmd = self._build_cmd(ip_range, port, run_dir, output_args)
+        logging.info(f"Starting masscan on {ip_range} (shard {self.shard[0]}/{self.shard[1]})...")
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            cwd=run_dir,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        self.status_task = asyncio.create_task(self._monitor_masscan(process))
+        return process
+
+    async def _finish(self, process, run_dir):
+        """
+        Stop the status monitor and clean up after masscan. If the scan is being
+        abandoned, interrupt masscan with SIGINT so it writes paused.conf for
+        the next run; if it completed, drop the stale resume file.
+        """
         try:
-            logging.info(f"Starting masscan on {ip_range}...")
-            # Use asyncio.create_subprocess_exec for non-blocking execution
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            # Start monitoring task
-            self.status_task = asyncio.create_task(self._monitor_masscan(process))
-            
-            # Wait for process to finish
-            await process.wait()
-            
+            if process.returncode is None:
+                if os.name == "posix":
+                    process.send_signal(signal.SIGINT)
+                else:
+                    process.terminate()
+                try:
+                    await asyncio.wait_for(process.wait(), timeout=10)
+                except asyncio.TimeoutError:
+                    process.kill()
+                    await process.wait()
+            elif process.returncode == 0:
+                resume_path = os.path.join(run_dir, RESUME_FILE)
+                if os.path.exists(resume_path):
+                    os.remove(resume_path)
+        finally:
             if self.status_task:
                 self.status_task.cancel()
                 try:
@@ -103,26 +262,114 @@ class MasscanWrapper:
                 except asyncio.CancelledError:
                     pass
                 self.status_task = None
-            
-            if not os.path.exists(output_file):
-                return []
 
-            with open(output_file, 'r') as f:
-                content = f.read().strip()
+    async def _drain_stdout(self, process, spill, ready):
+        """Read masscan -oL output into the spill as fast as masscan writes it"""
+        try:
+            async for line in process.stdout:
+                hit = self._parse_list_line(line.decode("utf-8", errors="ignore"))
+                if hit:
+                    spill.put(hit)
+                    MASSCAN_HITS.inc()
+                    ready.set()
+        finally:
+            ready.set()
+
+    async def stream_range(self, ip_range, port="25565", batch_size=None, flush_interval=None):
+        """
+        Runs masscan on a given IP range and yields lists of (ip, port) hits
+        as they are reported, instead of waiting for the scan to finish.
+        A batch is yielded once it reaches batch_size or flush_interval
+        seconds have passed since the last one.
+
+        masscan's stdout is drained continuously into a HitSpill, even while
+        the consumer is held back by queue backpressure: masscan keeps
+        transmitting at --max-rate, and a full pipe would make it drop replies.
+        """
+        batch_size = batch_size or CONFIG["MASSCAN_BATCH_SIZE"]
+        flush_interval = flush_interval or CONFIG["MASSCAN_FLUSH_INTERVAL"]
+        run_dir = self._run_dir(ip_range, port)
+        try:
+            process = await self._start(ip_range, port, run_dir, ["-oL", "-"])
+        except Exception as e:
+            logging.error(f"Error running masscan: {e}")
+            return
+
+        spill = HitSpill(os.path.join(run_dir, SPILL_FILE), CONFIG["MASSCAN_SPILL_MEMORY"])
+        ready = asyncio.Event()
+        reader = asyncio.create_task(self._drain_stdout(process, spill, ready))
+        loop = asyncio.get_running_loop()
+        last_flush = loop.time()
+        try:
+            while True:
+                if len(spill) >= batch_size or (spill and (reader.done() or loop.time() - last_flush >= flush_interval)):
+                    if spill.on_disk:
+                        logging.debug(f"Masscan consumer behind, {spill.on_disk} hits spilled to disk")
+                    yield spill.take(batch_size)
+                    last_flush = loop.time()
+                    continue
+                if reader.done():
+                    break
+                if not spill:
+                    last_flush = loop.time()
+
+                ready.clear()
+                try:
+                    await asyncio.wait_for(ready.wait(), timeout=max(0.0, flush_interval - (loop.time() - last_flush)))
+                except asyncio.TimeoutError:
+                    pass
+
+            # Surfaces a failed read
+            reader.result()
+            await process.wait()
+            if process.returncode != 0:
+                logging.error(f"Masscan exited with code {process.returncode} on {ip_range}")
+        except Exception as e:
+            logging.error(f"Error running masscan: {e}")
+        finally:
+            reader.cancel()
+            await self._finish(process, run_dir)
+            spill.close()
+
+    async def scan_range(self, ip_range, port="25565"):
+        """
+        Runs masscan on a given IP range.
+        Output is parsed from the shard's JSON output files once masscan exits.
+        """
+        run_dir = self._run_dir(ip_range, port)
+        output_file = os.path.join(run_dir, OUTPUT_FILE)
+        if os.path.exists(output_file):
+            # Keep the hits of an interrupted run, masscan overwrites its output on resume
+            part = 1
+            while os.path.exists(os.path.join(run_dir, f"masscan_out.{part}.json")):
+                part += 1
+            os.replace(output_file, os.path.join(run_dir, f"masscan_out.{part}.json"))
+
+        try:
+            process = await self._start(ip_range, port, run_dir, ["-oJ", OUTPUT_FILE])
+            try:
+                await process.wait()
+            finally:
+                await self._finish(process, run_dir)
+
+            results = []
+            output_files = sorted(glob.glob(os.path.join(run_dir, "masscan_out*.json")))
+            for path in output_files:
+                with open(path, 'r') as f:
+                    content = f.read().strip()
                 if not content:
-                    return []
+                    continue
                 # Masscan JSON output can sometimes be missing the closing bracket if interrupted
                 if not content.endswith(']'):
                     content += ']'
-                data = json.loads(content)
-            
-            os.remove(output_file)
-            
-            results = []
-            for entry in data:
-                ip = entry.get("ip")
-                for p in entry.get("ports", []):
-                    results.append((ip, p.get("port")))
+                for entry in json.loads(content):
+                    ip = entry.get("ip")
+                    for p in entry.get("ports", []):
+                        results.append((ip, p.get("port")))
+
+            for path in output_files:
+                os.remove(path)
+            MASSCAN_HITS.inc(len(results))
             return results
 
         except subprocess.CalledProcessError as e:
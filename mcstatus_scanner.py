@@ -1,31 +1,167 @@
-from mcstatus import JavaServer
+import ipaddress
 import logging
 import asyncio
-from typing import Optional, Dict
+import time
+from collections.abc import AsyncIterable, AsyncIterator, Iterable
+from typing import Optional, Dict, Union
+from config import CONFIG
+from server_list_ping import ping
+from concurrency_controller import AdaptiveConcurrency, SUCCESS, TIMEOUT, CONNECT_ERROR, OTHER
+from exclusion_list import ExclusionList, default_exclusions
+from metrics import PING_ATTEMPTS, PING_SUCCESSES, PING_TIMEOUTS, PING_RTT
 
 class MCStatusScanner:
-    def __init__(self):
+    def __init__(self, adaptive=None, exclusions: ExclusionList = None):
+        # Upper bound for a whole SLP probe, the per-phase timeouts below cap each step
         self.timeout = 5
+        self.connect_timeout = CONFIG["PING_CONNECT_TIMEOUT"]
+        self.handshake_timeout = CONFIG["PING_HANDSHAKE_TIMEOUT"]
+        self.read_timeout = CONFIG["PING_READ_TIMEOUT"]
+        self.exclusions = exclusions or default_exclusions()
+        adaptive = CONFIG["PING_ADAPTIVE"] if adaptive is None else adaptive
+        # Tunes probes in flight and the probe timeout to what the uplink handles
+        self.controller = AdaptiveConcurrency(max_timeout=self.timeout) if adaptive else None
+
+    def _probe_timeout(self) -> float:
+        return self.controller.timeout() if self.controller else self.timeout
+
+    def _record(self, outcome, rtt=None):
+        if self.controller:
+            self.controller.record(outcome, rtt)
+
+    @staticmethod
+    def _is_ip(host: str) -> bool:
+        try:
+            ipaddress.ip_address(host)
+            return True
+        except ValueError:
+            return False
+
+    async def _lookup_status(self, host: str, port: int) -> Optional[Dict]:
+        """Slow path for hostnames, resolves SRV records through mcstatus. None if it points at an excluded network"""
+        # mcstatus is only needed for hostnames, most workers ping bare IPs
+        from mcstatus import JavaServer
+        server = await JavaServer.async_lookup(f"{host}:{port}", timeout=self._probe_timeout())
+        if await self.exclusions.resolves_to_excluded(server.address.host, server.address.port):
+            return None
+        status = await server.async_status()
+        return {
+            "online": status.players.online,
+            "max_online": status.players.max,
+            "motd": status.description if isinstance(status.description, str) else str(status.description),
+            "version": status.version.name
+        }
 
     async def scan_server(self, ip: str, port: int = 25565) -> Optional[Dict]:
+        if self.exclusions.contains(ip):
+            return None
+        PING_ATTEMPTS.inc()
+        started = time.perf_counter()
+        timeout = self._probe_timeout()
         try:
-            server = JavaServer.lookup(f"{ip}:{port}")
-            # Use async status for better performance with many servers
-            status = await server.async_status()
-            
-            return {
-                "ip": ip,
-                "port": port,
-                "online": status.players.online,
-                "max_online": status.players.max,
-                "motd": status.description if isinstance(status.description, str) else str(status.description),
-                "version": status.version.name
-            }
+            if self._is_ip(ip):
+                # Bare IP:port (e.g. masscan hits), talk SLP directly without any lookup
+                res = await asyncio.wait_for(ping(
+                    ip, port,
+                    connect_timeout=min(self.connect_timeout, timeout),
+                    handshake_timeout=min(self.handshake_timeout, timeout),
+                    read_timeout=min(self.read_timeout, timeout)
+                ), timeout)
+                status = {
+                    "online": res.online,
+                    "max_online": res.max_online,
+                    "motd": res.motd,
+                    "version": res.version
+                }
+            else:
+                status = await self._lookup_status(ip, port)
+                if status is None:
+                    return None
+
+            rtt = time.perf_counter() - started
+            PING_SUCCESSES.inc()
+            PING_RTT.observe(rtt)
+            self._record(SUCCESS, rtt)
+            return {"ip": ip, "port": port, **status}
+        except asyncio.TimeoutError:
+            PING_TIMEOUTS.inc()
+            self._record(TIMEOUT)
+            return None
+        except OSError:
+            # Refused/reset/unreachable, or out of sockets when running too hot
+            self._record(CONNECT_ERROR)
+            return None
         except Exception as e:
             # Common for servers that are actually offline or not MC
+            self._record(OTHER)
             return None
 
+    async def stream_scan(self, targets: Union[Iterable, AsyncIterable], limit: Optional[int] = None) -> AsyncIterator[Dict]:
+        """
+        Scan (ip, port) targets from a sync or async iterable, keeping at most
+        `limit` probes in flight (fewer while the adaptive controller backs
+        off) and yielding results as they complete. Targets are only pulled
+        from the iterable when a slot frees up.
+        """
+        limit = limit or CONFIG["PING_CONCURRENCY"]
+        if self.controller:
+            self.controller.set_max_limit(limit)
+        is_async = isinstance(targets, AsyncIterable)
+        iterator = targets.__aiter__() if is_async else iter(targets)
+
+        pending = set()
+        # Finished probes (and fetches) land here via done callbacks, so each
+        # completion costs O(1) instead of re-waiting on every pending task
+        completed = asyncio.Queue()
+
+        def start(ip, port):
+            task = asyncio.create_task(self.scan_server(ip, port))
+            task.add_done_callback(completed.put_nowait)
+            pending.add(task)
+
+        # An async source (e.g. a queue) may block for a while, so the next
+        # target is awaited alongside running probes instead of before them
+        fetch = None
+        exhausted = False
+        try:
+            while True:
+                in_flight_limit = min(limit, self.controller.current_limit) if self.controller else limit
+                if is_async:
+                    if fetch is None and not exhausted and len(pending) < in_flight_limit:
+                        fetch = asyncio.ensure_future(iterator.__anext__())
+                        fetch.add_done_callback(completed.put_nowait)
+                else:
+                    while not exhausted and len(pending) < in_flight_limit:
+                        try:
+                            ip, port = next(iterator)
+                        except StopIteration:
+                            exhausted = True
+                            break
+                        start(ip, port)
+
+                if not pending and fetch is None:
+                    return
+
+                done = await completed.get()
+                if done is fetch:
+                    fetch = None
+                    try:
+                        ip, port = done.result()
+                        start(ip, port)
+                    except StopAsyncIteration:
+                        exhausted = True
+                    continue
+
+                pending.discard(done)
+                res = done.result()
+                if res is not None:
+                    yield res
+        finally:
+            for task in pending:
+                task.cancel()
+            if fetch:
+                fetch.cancel()
+
     async def batch_scan(self, targets: list[tuple[str, int]]):
-        tasks = [self.scan_server(ip, port) for ip, port in targets]
-        results = await asyncio.gather(*tasks)
-        return [r for r in results if r is not None]
+        return [r async for r in self.stream_scan(targets)]
+
@@ -0,0 +1,229 @@
+import asyncio
+import bisect
+import logging
+import time
+from config import CONFIG
+
+# Latency buckets in seconds, shared by the histograms below
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REGISTRY = []
+_collectors = []
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+class Counter:
+    """Monotonic count, optionally split by label values"""
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.values = {}
+        REGISTRY.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self.values.get(tuple(sorted(labels.items())), 0)
+
+    def render(self):
+        if not self.values and self.kind == "counter":
+            return [f"{self.name} 0"]
+        return [f"{self.name}{_format_labels(key)} {value}" for key, value in self.values.items()]
+
+
+class Gauge(Counter):
+    """Current value, optionally split by label values"""
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        self.values[tuple(sorted(labels.items()))] = value
+
+
+class Histogram:
+    """Distribution of observations over fixed buckets (cumulative on export)"""
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        REGISTRY.append(self)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self):
+        return list(self.counts), self.count, self.sum
+
+    def quantile(self, q, since=None):
+        """
+        Upper bound of the bucket holding the q-th quantile, over all
+        observations or those after a snapshot() taken earlier
+        """
+        counts, count = self.counts, self.count
+        if since is not None:
+            counts = [now - then for now, then in zip(counts, since[0])]
+            count -= since[1]
+        if count == 0:
+            return None
+        rank = q * count
+        seen = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            seen += bucket_count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def render(self):
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            cumulative += bucket_count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+MASSCAN_HITS = Counter("mcscanner_masscan_hits_total", "Open ports reported by masscan")
+PING_ATTEMPTS = Counter("mcscanner_ping_attempts_total", "Server list pings started")
+PING_SUCCESSES = Counter("mcscanner_ping_successes_total", "Server list pings that returned a status")
+PING_TIMEOUTS = Counter("mcscanner_ping_timeouts_total", "Server list pings that timed out")
+PING_RTT = Histogram("mcscanner_ping_rtt_seconds", "Round trip time of successful pings")
+FILTER_CHECKED = Counter("mcscanner_filter_checked_total", "Pinged servers checked against the player filters")
+FILTER_PASSED = Counter("mcscanner_filter_passed_total", "Pinged servers that passed the player filters")
+DB_FLUSH_SECONDS = Histogram("mcscanner_db_flush_seconds", "Time to commit one batch of server rows")
+DB_ROWS_WRITTEN = Counter("mcscanner_db_rows_written_total", "Server rows committed to the database")
+WEBHOOK_SENT = Counter("mcscanner_webhook_alerts_sent_total", "Alerts delivered to the webhook")
+WEBHOOK_DROPPED = Counter("mcscanner_webhook_alerts_dropped_total", "Alerts dropped because the webhook buffer was full")
+PING_LIMIT = Gauge("mcscanner_ping_concurrency_limit", "Pings allowed in flight by the adaptive controller")
+PING_TIMEOUT_SECONDS = Gauge("mcscanner_ping_timeout_seconds", "Probe timeout derived from recent ping RTTs")
+EXCLUDED_TARGETS = Counter("mcscanner_excluded_targets_total", "Targets dropped because they are on the exclusion list")
+QUEUE_DEPTH = Gauge("mcscanner_queue_depth", "Tasks waiting in each queue stage")
+LOOP_LAG = Histogram("mcscanner_loop_lag_seconds", "How late the event loop woke up from a timed sleep")
+
+
+def add_collector(collect):
+    """Register an async callable that refreshes gauges right before they are exported"""
+    _collectors.append(collect)
+
+
+async def collect():
+    for collector in _collectors:
+        try:
+            await collector()
+        except Exception as e:
+            logging.warning(f"Metrics collector failed: {e}")
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+async def _handle(reader, writer):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        # Skip the request headers
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            await collect()
+            status, body = "200 OK", render().encode("utf-8")
+        else:
+            status, body = "404 Not Found", b"Not Found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host=None, port=None):
+    """Expose /metrics over HTTP until cancelled, does nothing if no port is configured"""
+    host = host or CONFIG["METRICS_HOST"]
+    port = CONFIG["METRICS_PORT"] if port is None else port
+    if not port:
+        return
+    server = await asyncio.start_server(_handle, host, port)
+    logging.info(f"Serving metrics on http://{host}:{port}/metrics")
+    async with server:
+        await server.serve_forever()
+
+
+class DashboardSummary:
+    """Per-interval rates and latencies for the periodic dashboard log"""
+    def __init__(self):
+        self._last_time = time.monotonic()
+        self._last = self._snapshot()
+
+    @staticmethod
+    def _snapshot():
+        return {
+            "hits": MASSCAN_HITS.value(),
+            "attempts": PING_ATTEMPTS.value(),
+            "successes": PING_SUCCESSES.value(),
+            "timeouts": PING_TIMEOUTS.value(),
+            "checked": FILTER_CHECKED.value(),
+            "passed": FILTER_PASSED.value(),
+            "rows": DB_ROWS_WRITTEN.value(),
+            "sent": WEBHOOK_SENT.value(),
+            "dropped": WEBHOOK_DROPPED.value(),
+            "rtt": PING_RTT.snapshot(),
+            "flush": DB_FLUSH_SECONDS.snapshot(),
+        }
+
+    def lines(self):
+        now = time.monotonic()
+        elapsed = max(now - self._last_time, 1e-9)
+        current = self._snapshot()
+        delta = {key: current[key] - self._last[key] for key in current if key not in ("rtt", "flush")}
+
+        def ms(value):
+            return "n/a" if value is None else f"<={value * 1000:.0f} ms"
+
+        rtt_p95 = PING_RTT.quantile(0.95, since=self._last["rtt"])
+        flush_p95 = DB_FLUSH_SECONDS.quantile(0.95, since=self._last["flush"])
+        success_rate = delta["successes"] / delta["attempts"] * 100 if delta["attempts"] else 0.0
+        pass_rate = delta["passed"] / delta["checked"] * 100 if delta["checked"] else 0.0
+
+        adaptive = ""
+        if PING_LIMIT.values:
+            adaptive = f" | limit {PING_LIMIT.value()} | timeout {PING_TIMEOUT_SECONDS.value():.2f}s"
+
+        self._last_time, self._last = now, current
+        return [
+            f"Masscan: {delta['hits'] / elapsed:.1f} hits/s",
+            f"Ping: {delta['attempts'] / elapsed:.1f} attempts/s | {success_rate:.1f}% ok | "
+            f"{delta['timeouts']} timeouts | RTT p95 {ms(rtt_p95)}{adaptive}",
+            f"Filter: {delta['passed']}/{delta['checked']} passed ({pass_rate:.1f}%)",
+            f"DB: {delta['rows'] / elapsed:.1f} rows/s | flush p95 {ms(flush_p95)}",
+            f"Webhook: {delta['sent']} sent | {delta['dropped']} dropped",
+        ]
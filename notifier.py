@@ -1,14 +1,30 @@
-import aiohttp
-import json
+import asyncio
 import logging
 from datetime import datetime
 from config import CONFIG
+from metrics import WEBHOOK_SENT, WEBHOOK_DROPPED
+
+# Discord accepts at most 10 embeds per message
+MAX_EMBEDS = 10
 
 class WebhookNotifier:
-    def __init__(self):
-        self.url = CONFIG.get("WEBHOOK_URL")
+    """
+    Delivers discovery alerts from a background task. notify_discovery only
+    queues the embed, run() batches queued embeds into as few webhook
+    messages as possible over one persistent session. When the buffer is
+    full new alerts are dropped and summarized in a single extra embed.
+    """
+    def __init__(self, url=None, max_pending=None, batch_interval=None, retries=3):
+        self.url = url if url is not None else CONFIG.get("WEBHOOK_URL")
+        self.batch_interval = CONFIG["WEBHOOK_BATCH_INTERVAL"] if batch_interval is None else batch_interval
+        self.retries = retries
+        self.pending = asyncio.Queue(maxsize=max_pending or CONFIG["WEBHOOK_QUEUE_SIZE"])
+        self.session = None
+        self.dropped = 0
+        self.sent = 0
 
-    async def notify_discovery(self, server_data: dict):
+    def notify_discovery(self, server_data: dict):
+        """Queue an alert for the background sender, never waits"""
         if not self.url:
             return
 
@@ -25,12 +41,94 @@ class WebhookNotifier:
             "timestamp": datetime.now().isoformat()
         }
 
-        payload = {"embeds": [embed]}
-        
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(self.url, json=payload) as resp:
-                    if resp.status != 204:
-                        logging.warning(f"Discord webhook failed with status {resp.status}")
-        except Exception as e:
-            logging.error(f"Error sending webhook: {e}")
+            self.pending.put_nowait(embed)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            WEBHOOK_DROPPED.inc()
+
+    def _overflow_embed(self):
+        embed = {
+            "title": f"⚠️ {self.dropped} more server(s) discovered",
+            "description": "Alerts were arriving faster than the webhook accepts them, see the database for details.",
+            "color": 0xffaa00,
+            "timestamp": datetime.now().isoformat()
+        }
+        self.dropped = 0
+        return embed
+
+    async def _next_batch(self):
+        """
+        Wait for an alert, then collect whatever else arrives within
+        batch_interval. Returns the embeds and how many of them are alerts
+        """
+        batch = [await self.pending.get()]
+        deadline = asyncio.get_running_loop().time() + self.batch_interval
+        while len(batch) < MAX_EMBEDS:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.pending.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        if self.dropped:
+            if len(batch) == MAX_EMBEDS:
+                # Make room for the summary, the bumped alert counts as dropped too
+                batch.pop()
+                self.dropped += 1
+                WEBHOOK_DROPPED.inc()
+            alerts = len(batch)
+            batch.append(self._overflow_embed())
+            return batch, alerts
+        return batch, len(batch)
+
+    async def _send(self, embeds, alerts):
+        import aiohttp
+        payload = {"embeds": embeds}
+        failures = 0
+        while failures < self.retries:
+            try:
+                async with self.session.post(self.url, json=payload) as resp:
+                    if resp.status == 429:
+                        retry_after = await self._retry_after(resp)
+                        logging.warning(f"Discord webhook rate limited, retrying in {retry_after:.1f}s")
+                        await asyncio.sleep(retry_after)
+                        continue
+                    if resp.status in (200, 204):
+                        # The overflow summary is not a delivered alert
+                        self.sent += alerts
+                        WEBHOOK_SENT.inc(alerts)
+                        return
+                    logging.warning(f"Discord webhook failed with status {resp.status}")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logging.error(f"Error sending webhook: {e}")
+            failures += 1
+            await asyncio.sleep(2 ** failures)
+        logging.error(f"Giving up on {len(embeds)} webhook alert(s) after {self.retries} attempts")
+
+    @staticmethod
+    async def _retry_after(resp):
+        """Seconds to wait after a 429, from Discord's JSON body or the Retry-After header"""
+        import aiohttp
+        try:
+            return float((await resp.json())["retry_after"])
+        except (aiohttp.ContentTypeError, ValueError, KeyError, TypeError):
+            pass
+        try:
+            return float(resp.headers.get("Retry-After", 1))
+        except ValueError:
+            return 1.0
+
+    async def run(self):
+        """Background sender, one webhook message per batch of up to 10 alerts"""
+        if not self.url:
+            return
+        # Deferred so nodes without a webhook never load aiohttp
+        import aiohttp
+        self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=CONFIG["WEBHOOK_TIMEOUT"]))
+        try:
+            while True:
+                await self._send(*await self._next_batch())
+        finally:
+            await self.session.close()
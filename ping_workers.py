@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import multiprocessing
+import queue as queue_module
+import sys
+from config import CONFIG
+from mcstatus_scanner import MCStatusScanner
+from metrics import FILTER_CHECKED, FILTER_PASSED
+from queue_manager import TaskQueue
+
+FEED_BATCH_SIZE = 100
+
+
+def is_promising(res: dict) -> bool:
+    return res['online'] <= CONFIG["TARGET_PLAYER_MAX"] and res['max_online'] <= CONFIG["SERVER_PLAYER_CAP"]
+
+
+async def iter_stage(queue: TaskQueue, stage: str, batch_size: int):
+    """Endless (ip, port) stream from a queue stage, popping up to batch_size per round trip"""
+    while True:
+        for task in await queue.dequeue_batch(batch_size, stage):
+            yield task['ip'], task['port']
+
+
+async def ping_stage(scanner: MCStatusScanner, targets, concurrency: int, emit):
+    """Ping targets with up to `concurrency` probes in flight, awaiting emit(res) for promising servers"""
+    async for res in scanner.stream_scan(targets, limit=concurrency):
+        FILTER_CHECKED.inc()
+        if is_promising(res):
+            FILTER_PASSED.inc()
+            await emit(res)
+
+
+async def enqueue_pinged(queue: TaskQueue, res: dict):
+    await queue.wait_for_capacity("pinged")
+    await queue.enqueue_batch([res], stage="pinged")
+
+
+def _setup_child_logging():
+    # spawn re-imports main.py as __mp_main__, whose basicConfig (with the
+    # scanner.log file handler) has already run, so replace its handlers
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s | %(levelname)s | %(processName)s | %(message)s',
+        handlers=[logging.StreamHandler(sys.stdout)],
+        force=True
+    )
+
+
+def _redis_worker_main(concurrency):
+    """Child process: consume 'raw' from Redis and push promising servers to 'pinged' directly"""
+    _setup_child_logging()
+
+    async def run():
+        queue = TaskQueue(use_redis=True, host=CONFIG["REDIS_HOST"], port=CONFIG["REDIS_PORT"])
+        scanner = MCStatusScanner()
+        await ping_stage(scanner, iter_stage(queue, "raw", concurrency), concurrency,
+                         lambda res: enqueue_pinged(queue, res))
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+def _local_worker_main(task_q, result_q, concurrency):
+    """Child process: ping target batches from task_q and send promising servers back on result_q"""
+    _setup_child_logging()
+
+    async def targets():
+        while True:
+            batch = await asyncio.to_thread(task_q.get)
+            if batch is None:
+                return
+            for target in batch:
+                yield target
+
+    async def emit(res):
+        result_q.put(res)
+
+    try:
+        asyncio.run(ping_stage(MCStatusScanner(), targets(), concurrency, emit))
+    except KeyboardInterrupt:
+        pass
+
+
+class PingWorkerPool:
+    """
+    Runs the ping stage in N worker processes, each with its own event loop.
+    With Redis the children share the queue directly. In local mode the
+    parent feeds 'raw' tasks to the children over a multiprocessing queue
+    and is the single writer of their results into the 'pinged' stage.
+    """
+    def __init__(self, queue: TaskQueue, processes: int, concurrency=None, on_dispatch=None):
+        self.queue = queue
+        # Called with each batch of tasks handed to the workers (local mode only)
+        self.on_dispatch = on_dispatch
+        self.processes = processes
+        self.concurrency = concurrency or CONFIG["PING_CONCURRENCY"]
+        self.ctx = multiprocessing.get_context("spawn")
+        self.workers = []
+        self.task_q = None
+        self.result_q = None
+
+    def _spawn(self, index):
+        if self.queue.use_redis:
+            target, args = _redis_worker_main, (self.concurrency,)
+        else:
+            target, args = _local_worker_main, (self.task_q, self.result_q, self.concurrency)
+        process = self.ctx.Process(target=target, args=args, name=f"ping-worker-{index}", daemon=True)
+        process.start()
+        return process
+
+    async def _supervise(self):
+        """Restart worker processes that died"""
+        while True:
+            await asyncio.sleep(5)
+            for i, process in enumerate(self.workers):
+                if not process.is_alive():
+                    logging.warning(f"Ping worker {process.name} exited with code {process.exitcode}, restarting...")
+                    self.workers[i] = self._spawn(i)
+
+    async def _feed(self):
+        """Move 'raw' tasks from the local queue to the worker processes"""
+        while True:
+            tasks = await self.queue.dequeue_batch(FEED_BATCH_SIZE, "raw")
+            if not tasks:
+                continue
+            if self.on_dispatch:
+                self.on_dispatch(tasks)
+            batch = [(t['ip'], t['port']) for t in tasks]
+            # task_q is bounded, so this waits (off the loop) while the workers are saturated.
+            # Short timeouts keep the helper thread from outliving a cancelled pool.
+            while True:
+                try:
+                    await asyncio.to_thread(self.task_q.put, batch, True, 1)
+                    break
+                except queue_module.Full:
+                    continue
+
+    async def _collect(self):
+        """Funnel worker results into the 'pinged' stage"""
+        while True:
+            try:
+                res = await asyncio.to_thread(self.result_q.get, True, 1)
+            except queue_module.Empty:
+                continue
+            await enqueue_pinged(self.queue, res)
+
+    async def run(self):
+        if not self.queue.use_redis:
+            self.task_q = self.ctx.Queue(maxsize=self.processes * 2)
+            self.result_q = self.ctx.Queue()
+
+        self.workers = [self._spawn(i) for i in range(self.processes)]
+        logging.info(f"Started {self.processes} ping worker process(es) with {self.concurrency} probes each.")
+
+        loops = [self._supervise()]
+        if not self.queue.use_redis:
+            loops += [self._feed(), self._collect()]
+        try:
+            await asyncio.gather(*loops)
+        finally:
+            for process in self.workers:
+                process.terminate()
+            for process in self.workers:
+                process.join(timeout=5)
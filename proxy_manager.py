@@ -2,6 +2,7 @@ import random
 import logging
 import time
 import os
+import threading
 import requests
 from datetime import datetime, timedelta
 from config import CONFIG
@@ -13,6 +14,8 @@ class ProxyManager:
         self.current_proxy = None
         self.last_rotation_time = datetime.min
         self.rotation_interval = timedelta(minutes=5)
+        # mark_failed may run in several executor threads at once
+        self._file_lock = threading.Lock()
         if not skip_fetch:
             self.fetch_from_api()
         self.load_proxies()
@@ -81,20 +84,25 @@ class ProxyManager:
 
         return {"http": self.current_proxy, "https": self.current_proxy}
 
-    def mark_failed(self):
-        """Discard unusable proxy and force rotation"""
-        if self.current_proxy in self.proxies:
-            logging.warning(f"Discarding unusable proxy: {self.current_proxy}")
-            self.proxies.remove(self.current_proxy)
+    def mark_failed(self, proxy=None):
+        """
+        Discard an unusable proxy (the current one by default) and force
+        rotation. Rewrites the proxy file, so async callers run it in a thread
+        """
+        proxy = proxy or self.current_proxy
+        if proxy in self.proxies:
+            logging.warning(f"Discarding unusable proxy: {proxy}")
+            self.proxies.remove(proxy)
             # Update the file to remove the dead proxy
             try:
-                raw_proxy = self.current_proxy.replace("http://", "").replace("https://", "")
-                with open(self.proxy_file, 'r') as f:
-                    lines = f.readlines()
-                with open(self.proxy_file, 'w') as f:
-                    for line in lines:
-                        if line.strip() != raw_proxy:
-                            f.write(line)
+                raw_proxy = proxy.replace("http://", "").replace("https://", "")
+                with self._file_lock:
+                    with open(self.proxy_file, 'r') as f:
+                        lines = f.readlines()
+                    with open(self.proxy_file, 'w') as f:
+                        for line in lines:
+                            if line.strip() != raw_proxy:
+                                f.write(line)
             except Exception as e:
                 logging.error(f"Failed to update proxy file: {e}")
                 
@@ -1,50 +1,191 @@
 import asyncio
-import json
 import logging
+import time
 from typing import Optional
-import redis.asyncio as redis
 from config import CONFIG
+from task_codec import decode_task, encode_task, target_key
+from exclusion_list import ExclusionList, default_exclusions
+
+# Pipeline stages, each with its own queue:
+#   raw      - bare IP:port hits from masscan, waiting to be pinged
+#   pinged   - servers that answered a status ping and passed the player filters
+#   enriched - deep-checked prime targets, waiting to be saved and announced
+STAGES = ("raw", "pinged", "enriched")
+
+# Atomically skip targets seen within the dedup window and push the rest.
+# KEYS: queue, current seen-set, previous seen-set
+# ARGV: ttl, then alternating dedup key / encoded task
+DEDUP_ENQUEUE_SCRIPT = """
+local pushed = 0
+for i = 2, #ARGV, 2 do
+    if redis.call('SISMEMBER', KEYS[3], ARGV[i]) == 0 and redis.call('SADD', KEYS[2], ARGV[i]) == 1 then
+        redis.call('LPUSH', KEYS[1], ARGV[i + 1])
+        pushed = pushed + 1
+    end
+end
+redis.call('EXPIRE', KEYS[2], tonumber(ARGV[1]) * 2)
+return pushed
+"""
 
 class TaskQueue:
-    def __init__(self, use_redis=False, host='localhost', port=6379, db=0):
+    def __init__(self, use_redis=False, host='localhost', port=6379, db=0, stages=STAGES, exclusions: ExclusionList = None):
         self.use_redis = use_redis
+        self.stages = stages
+        # Excluded IPs are dropped on every enqueue, so they never cost a ping
+        self.exclusions = exclusions or default_exclusions()
+        # A target enqueued with dedup is dropped if seen within the last
+        # dedup_ttl to 2 * dedup_ttl seconds (two rotating generations of seen-sets)
+        self.dedup_ttl = CONFIG["QUEUE_DEDUP_TTL"]
+        if CONFIG["RECHECK_TTL"] > 0:
+            # RECHECK_TTL decides when a target may be pinged again, so dedup
+            # must have forgotten it by then
+            self.dedup_ttl = min(self.dedup_ttl, CONFIG["RECHECK_TTL"] // 2)
+        # Producers pause once a stage's backlog reaches its high watermark and
+        # resume when it has drained to the low watermark
+        self.watermarks = CONFIG["QUEUE_WATERMARKS"]
+        self.paused = {stage: False for stage in stages}
         if self.use_redis:
-            self.redis = redis.Redis(host=host, port=port, db=db, decode_responses=True)
-            self.queue_name = "mc_scan_tasks"
+            # Imported here so local-mode processes never load the client
+            import redis.asyncio as redis
+            self.redis = redis.Redis(host=host, port=port, db=db)
+            self.queue_names = {stage: f"mc_scan_tasks:{stage}" for stage in stages}
+            self._dedup_enqueue = self.redis.register_script(DEDUP_ENQUEUE_SCRIPT)
         else:
-            self.local_queue = asyncio.Queue()
+            self.local_queues = {stage: asyncio.Queue() for stage in stages}
+            self._seen_generation = 0
+            self._seen_current = set()
+            self._seen_previous = set()
             logging.info("Using in-memory task queue (Local Mode).")
 
-    async def enqueue_batch(self, targets: list[dict]):
+    def _local_dedup(self, targets: list[dict]) -> list[dict]:
+        generation = int(time.time() // self.dedup_ttl)
+        if generation != self._seen_generation:
+            self._seen_previous = self._seen_current if generation == self._seen_generation + 1 else set()
+            self._seen_current = set()
+            self._seen_generation = generation
+
+        fresh = []
+        for target in targets:
+            key = target_key(target)
+            if key in self._seen_previous or key in self._seen_current:
+                continue
+            self._seen_current.add(key)
+            fresh.append(target)
+        return fresh
+
+    async def enqueue_batch(self, targets: list[dict], stage: str = "raw", dedup: Optional[bool] = None) -> int:
+        """
+        Push targets onto a stage's queue, returns how many were enqueued.
+        Dedup defaults to on for the 'raw' entry stage, pass dedup=True for
+        other entry points (e.g. scraped servers) and False for rechecks.
+        """
+        targets = self.exclusions.filter(targets)
         if not targets:
-            return
-        
+            return 0
+        total = len(targets)
+        if dedup is None:
+            dedup = stage == "raw"
+        dedup = dedup and self.dedup_ttl > 0
+
         if self.use_redis:
-            async with self.redis.pipeline() as pipe:
+            name = self.queue_names[stage]
+            if dedup:
+                generation = int(time.time() // self.dedup_ttl)
+                args = [self.dedup_ttl]
                 for target in targets:
-                    target_json = json.dumps(target)
-                    await pipe.lpush(self.queue_name, target_json)
-                await pipe.execute()
+                    args.append(target_key(target))
+                    args.append(encode_task(target))
+                keys = [name, f"mc_scan_seen:{generation}", f"mc_scan_seen:{generation - 1}"]
+                enqueued = await self._dedup_enqueue(keys=keys, args=args)
+            else:
+                await self.redis.lpush(name, *(encode_task(target) for target in targets))
+                enqueued = len(targets)
         else:
+            if dedup:
+                targets = self._local_dedup(targets)
             for target in targets:
-                await self.local_queue.put(target)
-                
-        logging.info(f"Enqueued {len(targets)} tasks.")
+                await self.local_queues[stage].put(target)
+            enqueued = len(targets)
+
+        skipped = total - enqueued
+        logging.info(f"Enqueued {enqueued} tasks to '{stage}'." + (f" Skipped {skipped} duplicates." if skipped else ""))
+        return enqueued
+
+    async def wait_for_capacity(self, stage: str = "raw", poll_interval: float = 1.0):
+        """Block a producer while the stage is over its high watermark, until it drains to the low one"""
+        limits = self.watermarks.get(stage)
+        if not limits:
+            return
+        high, low = limits
 
-    async def dequeue(self) -> Optional[dict]:
+        size = await self.get_queue_size(stage)
+        if not self.paused[stage]:
+            if size < high:
+                return
+            self.paused[stage] = True
+            logging.warning(f"Queue '{stage}' backlog at {size} (high watermark {high}), pausing producers.")
+
+        while size > low:
+            await asyncio.sleep(poll_interval)
+            size = await self.get_queue_size(stage)
+
+        if self.paused[stage]:
+            self.paused[stage] = False
+            logging.info(f"Queue '{stage}' drained to {size} (low watermark {low}), resuming producers.")
+
+    async def dequeue(self, stage: str = "raw", timeout: Optional[float] = None) -> Optional[dict]:
+        """Wait up to `timeout` seconds for a task, returns None if none arrived"""
+        timeout = CONFIG["QUEUE_BLOCK_TIMEOUT"] if timeout is None else timeout
         if self.use_redis:
-            target_json = await self.redis.rpop(self.queue_name)
-            if target_json:
-                return json.loads(target_json)
+            item = await self.redis.brpop(self.queue_names[stage], timeout=timeout)
+            if item:
+                return decode_task(item[1])
         else:
             try:
-                # Use non-blocking get or short timeout for local queue
-                return await asyncio.wait_for(self.local_queue.get(), timeout=0.1)
-            except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                return await asyncio.wait_for(self.local_queues[stage].get(), timeout=timeout)
+            except asyncio.TimeoutError:
                 return None
         return None
 
-    async def get_queue_size(self):
+    async def dequeue_batch(self, n: int, stage: str = "raw", timeout: Optional[float] = None) -> list[dict]:
+        """
+        Wait up to `timeout` seconds for the first task, then take up to n - 1
+        more that are already queued without waiting again.
+        """
+        first = await self.dequeue(stage, timeout)
+        if first is None:
+            return []
+
+        tasks = [first]
+        if n <= 1:
+            return tasks
+        if self.use_redis:
+            # RPOP with a count pops many in one round trip (Redis >= 6.2)
+            rest = await self.redis.rpop(self.queue_names[stage], n - 1)
+            if rest:
+                tasks.extend(decode_task(item) for item in rest)
+        else:
+            queue = self.local_queues[stage]
+            while len(tasks) < n:
+                try:
+                    tasks.append(queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+        return tasks
+
+    async def get_queue_size(self, stage: Optional[str] = None):
+        """Backlog of one stage, or of all stages combined"""
+        if stage is None:
+            return sum((await self.get_stage_sizes()).values())
         if self.use_redis:
-            return await self.redis.llen(self.queue_name)
-        return self.local_queue.qsize()
+            return await self.redis.llen(self.queue_names[stage])
+        return self.local_queues[stage].qsize()
+
+    async def get_stage_sizes(self) -> dict[str, int]:
+        if self.use_redis:
+            async with self.redis.pipeline() as pipe:
+                for stage in self.stages:
+                    await pipe.llen(self.queue_names[stage])
+                sizes = await pipe.execute()
+            return dict(zip(self.stages, sizes))
+        return {stage: queue.qsize() for stage, queue in self.local_queues.items()}
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from config import CONFIG
+from task_codec import target_key
+
+class RecheckScheduler:
+    """
+    Skips targets that were checked within `ttl` seconds and periodically
+    re-queues known servers, stalest first. Recent check times live in an
+    in-memory LRU, misses fall back to the database's last_checked. The
+    ping and deep-check stages stamp targets through mark_checked() when
+    they actually probe them.
+    """
+    def __init__(self, db, queue, ttl=None, cache_size=None, interval=None, batch_size=None):
+        self.db = db
+        self.queue = queue
+        self.ttl = CONFIG["RECHECK_TTL"] if ttl is None else ttl
+        self.cache_size = cache_size or CONFIG["RECHECK_CACHE_SIZE"]
+        self.interval = interval or CONFIG["RECHECK_INTERVAL"]
+        self.batch_size = batch_size or CONFIG["RECHECK_BATCH_SIZE"]
+        self.cache = OrderedDict()
+        self.skipped = 0
+
+    def _remember(self, key, checked_at):
+        self.cache[key] = checked_at
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def mark_checked(self, targets, checked_at=None):
+        checked_at = checked_at or time.time()
+        for target in targets:
+            self._remember(target_key(target), checked_at)
+
+    async def filter_unchecked(self, targets: list[dict]) -> list[dict]:
+        """
+        Drop targets checked within the TTL. Doesn't mark the rest, so a target
+        dropped on enqueue (dedup, exclusions) isn't skipped without a check
+        """
+        if self.ttl <= 0 or not targets:
+            return targets
+
+        keys = [target_key(target) for target in targets]
+        misses = [(t['ip'], t['port']) for t, key in zip(targets, keys) if key not in self.cache]
+        if misses:
+            known = await asyncio.to_thread(self.db.get_last_checked, misses)
+            for target, key in zip(targets, keys):
+                if key not in self.cache:
+                    last_checked = known.get((target['ip'], target['port']))
+                    # Remember unknown targets too, so they don't hit the database again
+                    self._remember(key, _to_epoch(last_checked) if last_checked else 0.0)
+
+        now = time.time()
+        fresh = [target for target, key in zip(targets, keys) if now - self.cache[key] >= self.ttl]
+
+        self.skipped += len(targets) - len(fresh)
+        return fresh
+
+    async def run(self):
+        """Periodically re-queue known servers whose last check is older than the TTL"""
+        if self.ttl <= 0:
+            return
+        # Servers that fail a recheck keep their old last_checked, so page through
+        # the stale set instead of re-queueing the same stalest batch every time
+        after = None
+        while True:
+            try:
+                now = time.time()
+                cutoff = datetime.fromtimestamp(now - self.ttl)
+                stale = await asyncio.to_thread(self.db.get_stale_servers, cutoff, self.batch_size, after)
+                after = stale[-1][2] if len(stale) == self.batch_size else None
+
+                targets = []
+                for ip, port, _ in stale:
+                    target = {"ip": ip, "port": port}
+                    if now - self.cache.get(target_key(target), 0.0) >= self.ttl:
+                        targets.append(target)
+                if targets:
+                    # Keeps the next rounds from re-queueing them while they wait in the queue
+                    self.mark_checked(targets, now)
+                    await self.queue.wait_for_capacity("raw")
+                    await self.queue.enqueue_batch(targets, stage="raw", dedup=False)
+                    logging.info(f"Scheduled {len(targets)} known servers for recheck.")
+            except Exception as e:
+                logging.error(f"Recheck scheduling failed: {e}")
+            await asyncio.sleep(self.interval)
+
+
+def _to_epoch(value):
+    if isinstance(value, datetime):
+        return value.timestamp()
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return 0.0
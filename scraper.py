@@ -1,165 +1,163 @@
-import requests
-from bs4 import BeautifulSoup
+import asyncio
+import aiohttp
 import logging
-import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple, Optional
+from http_cache import HttpCache
 from proxy_manager import ProxyManager
+from scraper_sources import SOURCES, parse_page
 from config import CONFIG
 
+
+class FetchResult(NamedTuple):
+    status: int
+    html: Optional[str]
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+
 class ServerScraper:
-    def __init__(self, proxy_manager: ProxyManager = None):
+    def __init__(self, proxy_manager: ProxyManager = None, pages=None, sources=None):
         self.proxy_manager = proxy_manager
+        self.pages = pages or CONFIG["SCRAPER_PAGES"]
+        self.sources = sources if sources is not None else SOURCES
+        self.parse_executor = None
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
         }
+        self.session = None
+        # Listing pages rarely change between cycles, revalidate instead of re-downloading
+        self.cache = HttpCache() if CONFIG["SCRAPER_CACHE_DIR"] else None
 
-    def _get_request(self, url):
-        """Helper to handle requests with proxy rotation on failure/slowness/rate-limiting"""
-        proxies = self.proxy_manager.get_proxy() if self.proxy_manager else None
-        try:
-            response = requests.get(url, headers=self.headers, proxies=proxies, timeout=10)
-            
-            # Explicit check for Rate Limiting (HTTP 429)
-            if response.status_code == 429:
-                logging.warning(f"Rate limited (429) on {url} with proxy {proxies.get('http') if proxies else 'None'}. Rotating...")
-                if self.proxy_manager:
-                    self.proxy_manager.mark_failed() # Discard rate-limited proxy
-                return self._get_request(url) # Recursive retry with new proxy
-
-            response.raise_for_status()
-            return response
-        except (requests.RequestException, requests.Timeout) as e:
-            logging.warning(f"Request to {url} failed with proxy {proxies.get('http') if proxies else 'None'}: {e}")
-            if self.proxy_manager:
-                self.proxy_manager.mark_failed()
-            # Try once more with a new proxy
+    def _get_session(self):
+        """One pooled session for every source, with a per-host connection limit"""
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=CONFIG["SCRAPER_MAX_CONNECTIONS"],
+                limit_per_host=CONFIG["SCRAPER_PER_HOST_LIMIT"],
+                ttl_dns_cache=300
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(total=CONFIG["SCRAPER_TIMEOUT"])
+            )
+        return self.session
+
+    def _get_parse_executor(self):
+        """Process pool for parsing if SCRAPER_PARSE_PROCESSES is set, None means the loop's default thread pool"""
+        if self.parse_executor is None and CONFIG["SCRAPER_PARSE_PROCESSES"] > 0:
+            self.parse_executor = ProcessPoolExecutor(max_workers=CONFIG["SCRAPER_PARSE_PROCESSES"])
+        return self.parse_executor
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
+        if self.parse_executor:
+            self.parse_executor.shutdown(wait=False, cancel_futures=True)
+            self.parse_executor = None
+
+    async def _get_request(self, url, retries=3, cached=None):
+        """
+        Helper to handle requests with proxy rotation on failure/slowness/rate-limiting.
+        Sends the validators of a `cached` entry, returns a FetchResult (status 304
+        if the cached copy is still current) or None.
+        """
+        session = self._get_session()
+        headers = HttpCache.conditional_headers(cached)
+        for attempt in range(retries):
             proxies = self.proxy_manager.get_proxy() if self.proxy_manager else None
+            proxy = proxies.get('http') if proxies else None
             try:
-                response = requests.get(url, headers=self.headers, proxies=proxies, timeout=15)
-                if response.status_code == 429:
-                    if self.proxy_manager: self.proxy_manager.mark_failed()
-                    return None
-                response.raise_for_status()
-                return response
-            except Exception as retry_e:
-                logging.error(f"Retry to {url} also failed: {retry_e}")
-                return None
-
-    def scrape_minecraft_list_org(self):
-        """Example: Scrape minecraft-list.org (hypothetical target for small servers)"""
-        servers = []
-        url = "https://minecraft-list.org/servers/players"
-        response = self._get_request(url)
-        if not response:
-            return servers
+                async with session.get(url, proxy=proxy, headers=headers) as response:
+                    # Explicit check for Rate Limiting (HTTP 429)
+                    if response.status == 429:
+                        logging.warning(f"Rate limited (429) on {url} with proxy {proxy}. Rotating...")
+                        if self.proxy_manager:
+                            # Discard rate-limited proxy, rewrites the proxy file
+                            await asyncio.to_thread(self.proxy_manager.mark_failed, proxy)
+                        continue
 
-        try:
-            soup = BeautifulSoup(response.text, 'html.parser')
-            # This is a generic logic, would need adjustment per site
-            for row in soup.select(".server-row"):
-                players_text = row.select_one(".players").text.strip()
-                match = re.search(r'(\d+)\s*/\s*(\d+)', players_text)
-                if match:
-                    online = int(match.group(1))
-                    max_players = int(match.group(2))
-                    
-                    if 0 <= online <= 10 and max_players <= 50:
-                        ip = row.select_one(".ip").text.strip()
-                        servers.append({
-                            "ip": ip,
-                            "port": 25565,
-                            "online": online,
-                            "max_online": max_players
-                        })
-        except Exception as e:
-            logging.error(f"Error parsing minecraft-list.org: {e}")
-        return servers
+                    if response.status == 304 and cached is not None:
+                        return FetchResult(304, None, cached.etag, cached.last_modified)
 
-    def scrape_topg_org(self):
-        """Scrape topg.org for small servers"""
-        servers = []
-        url = "https://topg.org/minecraft-servers/"
-        response = self._get_request(url)
-        if not response:
-            return servers
+                    response.raise_for_status()
+                    return FetchResult(
+                        response.status,
+                        await response.text(),
+                        response.headers.get("ETag"),
+                        response.headers.get("Last-Modified")
+                    )
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logging.warning(f"Request to {url} failed with proxy {proxy}: {e}")
+                if self.proxy_manager:
+                    await asyncio.to_thread(self.proxy_manager.mark_failed, proxy)
 
-        try:
-            soup = BeautifulSoup(response.text, 'html.parser')
-            for row in soup.select(".server-list-item"):
-                players_div = row.select_one(".players")
-                if players_div:
-                    match = re.search(r'(\d+)\s*/\s*(\d+)', players_div.text)
-                    if match:
-                        online = int(match.group(1))
-                        max_p = int(match.group(2))
-                        if 0 <= online <= 10 and max_p <= 50:
-                            ip_btn = row.select_one(".copy-ip")
-                            if ip_btn and ip_btn.get("data-ip"):
-                                servers.append({
-                                    "ip": ip_btn["data-ip"],
-                                    "port": 25565,
-                                    "online": online,
-                                    "max_online": max_p
-                                })
-        except Exception as e:
-            logging.error(f"Error parsing topg.org: {e}")
-        return servers
+        logging.error(f"Giving up on {url} after {retries} attempts")
+        return None
+
+    async def _scrape_page(self, source, page):
+        url = source.page_url(page)
+        cached = await asyncio.to_thread(self.cache.get, url) if self.cache else None
+        if cached and self.cache.is_fresh(cached):
+            logging.debug(f"Using cached results for {url}")
+            return source.name, url, cached.servers
 
-    def scrape_minecraft_server_list_com(self):
-        """Scrape minecraft-server-list.com for small servers"""
-        servers = []
-        url = "https://minecraft-server-list.com/filter/players/1/"
-        response = self._get_request(url)
-        if not response:
-            return servers
+        result = await self._get_request(url, cached=cached)
+        if result is None:
+            return source.name, url, []
+        if result.status == 304:
+            logging.debug(f"{url} not modified, reusing cached results")
+            await asyncio.to_thread(self.cache.touch, cached)
+            return source.name, url, cached.servers
+        if not result.html:
+            return source.name, url, []
 
         try:
-            soup = BeautifulSoup(response.text, 'html.parser')
-            for row in soup.select("tr"):
-                ip_tag = row.select_one(".ip")
-                player_tag = row.select_one(".players")
-                
-                if ip_tag and player_tag:
-                    ip = ip_tag.text.strip()
-                    players_text = player_tag.text.strip()
-                    match = re.search(r'(\d+)\s*/\s*(\d+)', players_text)
-                    if match:
-                        online = int(match.group(1))
-                        max_p = int(match.group(2))
-                        if 0 <= online <= 10 and max_p <= 60:
-                            servers.append({
-                                "ip": ip,
-                                "port": 25565,
-                                "online": online,
-                                "max_online": max_p
-                            })
+            # Parsing is CPU bound, keep it off the event loop (thread, or process pool if configured)
+            loop = asyncio.get_running_loop()
+            servers = await loop.run_in_executor(self._get_parse_executor(), parse_page, source, result.html)
         except Exception as e:
-            logging.error(f"Error parsing minecraft-server-list.com: {e}")
-        return servers
+            logging.error(f"Error parsing {url}: {e}")
+            return source.name, url, []
 
-    def scrape_all(self):
-        all_found = []
-        
-        # Sources list with logging
-        sources = [
-            ("topg.org", self.scrape_topg_org),
-            ("minecraft-server-list.com", self.scrape_minecraft_server_list_com),
-            ("minecraft-list.org", self.scrape_minecraft_list_org)
+        if self.cache:
+            await asyncio.to_thread(self.cache.put, url, result.etag, result.last_modified, servers)
+        return source.name, url, servers
+
+    async def iter_servers(self):
+        """
+        Fetch every page of every source concurrently and yield each page's
+        new (not yet seen this cycle) servers as soon as it is parsed.
+        """
+        tasks = [
+            asyncio.create_task(self._scrape_page(source, page))
+            for source in self.sources
+            for page in range(1, self.pages + 1)
         ]
+        logging.info(f"Scraping {len(tasks)} pages from {len(self.sources)} sources...")
 
-        for name, func in sources:
-            logging.info(f"Scraping {name}...")
-            try:
-                found = func()
-                all_found.extend(found)
-                logging.info(f"Source {name} returned {len(found)} results.")
-            except Exception as e:
-                logging.error(f"Failed to scrape {name}: {e}")
-        
-        # Deduplicate results
-        unique = {}
-        for s in all_found:
-            key = f"{s['ip']}:{s['port']}"
-            unique[key] = s
-        
-        logging.info(f"Scraping complete. Total unique servers found: {len(unique)}")
-        return list(unique.values())
+        seen = set()
+        try:
+            for next_page in asyncio.as_completed(tasks):
+                name, url, found = await next_page
+                fresh = []
+                for s in found:
+                    key = f"{s['ip']}:{s['port']}"
+                    if key not in seen:
+                        seen.add(key)
+                        fresh.append(s)
+                logging.info(f"Source {name} returned {len(found)} results from {url}.")
+                if fresh:
+                    yield fresh
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        logging.info(f"Scraping complete. Total unique servers found: {len(seen)}")
+
+    async def scrape_all(self):
+        all_found = []
+        async for servers in self.iter_servers():
+            all_found.extend(servers)
+        return all_found
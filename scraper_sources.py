@@ -0,0 +1,140 @@
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+# Fastest available HTML backend: selectolax, then lxml (with cssselect), then BeautifulSoup
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:
+    HTMLParser = None
+
+try:
+    import lxml.html
+    import cssselect  # noqa: F401, needed by lxml's .cssselect()
+except ImportError:
+    lxml = None
+
+from bs4 import BeautifulSoup
+
+PLAYERS_RE = re.compile(r'(\d+)\s*/\s*(\d+)')
+
+
+@dataclass(frozen=True)
+class ScraperSource:
+    """
+    A server listing site. Each row matched by row_selector is one server,
+    the IP comes from ip_selector (its text, or ip_attr if set) and the
+    'online / max' player count from players_selector.
+    """
+    name: str
+    url_template: str
+    row_selector: str
+    ip_selector: str
+    players_selector: str
+    ip_attr: Optional[str] = None
+    first_page_url: Optional[str] = None
+    port: int = 25565
+    max_online: int = 10
+    max_players: int = 50
+
+    def page_url(self, page: int) -> str:
+        if page == 1 and self.first_page_url:
+            return self.first_page_url
+        return self.url_template.format(page=page)
+
+
+SOURCES = [
+    ScraperSource(
+        name="topg.org",
+        url_template="https://topg.org/minecraft-servers/page/{page}",
+        first_page_url="https://topg.org/minecraft-servers/",
+        row_selector=".server-list-item",
+        ip_selector=".copy-ip",
+        ip_attr="data-ip",
+        players_selector=".players",
+    ),
+    ScraperSource(
+        name="minecraft-server-list.com",
+        url_template="https://minecraft-server-list.com/filter/players/1/{page}/",
+        first_page_url="https://minecraft-server-list.com/filter/players/1/",
+        row_selector="tr",
+        ip_selector=".ip",
+        players_selector=".players",
+        max_players=60,
+    ),
+    # Hypothetical target for small servers, generic selectors would need adjustment per site
+    ScraperSource(
+        name="minecraft-list.org",
+        url_template="https://minecraft-list.org/servers/players/{page}",
+        first_page_url="https://minecraft-list.org/servers/players",
+        row_selector=".server-row",
+        ip_selector=".ip",
+        players_selector=".players",
+    ),
+]
+
+
+def register_source(source: ScraperSource):
+    """Add a listing site to the default set scraped by ServerScraper"""
+    SOURCES.append(source)
+
+
+def _rows_selectolax(html, source):
+    for row in HTMLParser(html).css(source.row_selector):
+        ip_node = row.css_first(source.ip_selector)
+        players_node = row.css_first(source.players_selector)
+        if ip_node is None or players_node is None:
+            continue
+        ip = ip_node.attributes.get(source.ip_attr) if source.ip_attr else ip_node.text()
+        yield ip, players_node.text()
+
+
+def _rows_lxml(html, source):
+    for row in lxml.html.fromstring(html).cssselect(source.row_selector):
+        ip_nodes = row.cssselect(source.ip_selector)
+        players_nodes = row.cssselect(source.players_selector)
+        if not ip_nodes or not players_nodes:
+            continue
+        ip = ip_nodes[0].get(source.ip_attr) if source.ip_attr else ip_nodes[0].text_content()
+        yield ip, players_nodes[0].text_content()
+
+
+def _rows_bs4(html, source):
+    for row in BeautifulSoup(html, 'html.parser').select(source.row_selector):
+        ip_node = row.select_one(source.ip_selector)
+        players_node = row.select_one(source.players_selector)
+        if ip_node is None or players_node is None:
+            continue
+        ip = ip_node.get(source.ip_attr) if source.ip_attr else ip_node.text
+        yield ip, players_node.text
+
+
+if HTMLParser is not None:
+    _iter_rows = _rows_selectolax
+elif lxml is not None:
+    _iter_rows = _rows_lxml
+else:
+    _iter_rows = _rows_bs4
+
+
+def parse_page(source: ScraperSource, html: str) -> list[dict]:
+    """
+    Extract small servers from one listing page. Module level so it can run
+    in a worker process.
+    """
+    servers = []
+    for ip, players_text in _iter_rows(html, source):
+        if not ip:
+            continue
+        match = PLAYERS_RE.search(players_text)
+        if not match:
+            continue
+        online, max_players = int(match.group(1)), int(match.group(2))
+        if 0 <= online <= source.max_online and max_players <= source.max_players:
+            servers.append({
+                "ip": ip.strip(),
+                "port": source.port,
+                "online": online,
+                "max_online": max_players
+            })
+    return servers
@@ -0,0 +1,143 @@
+import asyncio
+import json
+import struct
+import time
+from typing import NamedTuple
+
+# Protocol version sent in the handshake. Servers answer status requests for
+# any version, 47 (1.8) is what most clients and scanners use.
+PROTOCOL_VERSION = 47
+MAX_RESPONSE_SIZE = 2 * 1024 * 1024
+
+
+class PingResult(NamedTuple):
+    online: int
+    max_online: int
+    version: str
+    protocol: int
+    motd: str
+    latency_ms: float
+
+
+def _pack_varint(value: int) -> bytes:
+    value &= 0xFFFFFFFF
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _pack_string(value: str) -> bytes:
+    data = value.encode("utf-8")
+    return _pack_varint(len(data)) + data
+
+
+def _pack_packet(packet_id: int, payload: bytes = b"") -> bytes:
+    body = _pack_varint(packet_id) + payload
+    return _pack_varint(len(body)) + body
+
+
+def _unpack_varint(data: bytes, offset: int = 0) -> tuple[int, int]:
+    """Decode a varint from data at offset, returns (value, new_offset)"""
+    result = 0
+    for i in range(5):
+        if offset >= len(data):
+            raise ValueError("Truncated varint")
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7F) << (7 * i)
+        if not byte & 0x80:
+            return result, offset
+    raise ValueError("VarInt too big")
+
+
+async def _read_varint(reader: asyncio.StreamReader) -> int:
+    result = 0
+    for i in range(5):
+        byte = (await reader.readexactly(1))[0]
+        result |= (byte & 0x7F) << (7 * i)
+        if not byte & 0x80:
+            return result
+    raise ValueError("VarInt too big")
+
+
+def build_status_request(host: str, port: int) -> bytes:
+    """Handshake (next state = status) followed by an empty status request"""
+    handshake = (
+        _pack_varint(PROTOCOL_VERSION)
+        + _pack_string(host)
+        + struct.pack(">H", port)
+        + _pack_varint(1)
+    )
+    return _pack_packet(0x00, handshake) + _pack_packet(0x00)
+
+
+def flatten_description(description) -> str:
+    """Turn a chat component (str, dict or list) into plain text"""
+    if isinstance(description, str):
+        return description
+    if isinstance(description, list):
+        return "".join(flatten_description(part) for part in description)
+    if isinstance(description, dict):
+        text = str(description.get("text", ""))
+        for part in description.get("extra", []):
+            text += flatten_description(part)
+        return text
+    return str(description) if description is not None else ""
+
+
+def parse_status_response(payload: bytes, latency_ms: float) -> PingResult:
+    packet_id, offset = _unpack_varint(payload)
+    if packet_id != 0x00:
+        raise ValueError(f"Unexpected packet id {packet_id}")
+    length, offset = _unpack_varint(payload, offset)
+    raw = payload[offset:offset + length]
+    if len(raw) != length:
+        raise ValueError("Truncated status response")
+
+    status = json.loads(raw)
+    players = status.get("players") or {}
+    version = status.get("version") or {}
+    return PingResult(
+        online=int(players.get("online", 0)),
+        max_online=int(players.get("max", 0)),
+        version=str(version.get("name", "")),
+        protocol=int(version.get("protocol", -1)),
+        motd=flatten_description(status.get("description", "")),
+        latency_ms=latency_ms,
+    )
+
+
+async def ping(ip: str, port: int = 25565, connect_timeout: float = 3,
+               handshake_timeout: float = 2, read_timeout: float = 5) -> PingResult:
+    """
+    Query a server with the Server List Ping protocol over a bare IP:port.
+    No DNS/SRV resolution is done. Raises asyncio.TimeoutError, OSError or
+    ValueError when the target does not answer like a Minecraft server.
+    """
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(ip, port), timeout=connect_timeout
+    )
+    try:
+        started = time.perf_counter()
+        writer.write(build_status_request(ip, port))
+        await asyncio.wait_for(writer.drain(), timeout=handshake_timeout)
+
+        async def read_response():
+            length = await _read_varint(reader)
+            if length <= 0 or length > MAX_RESPONSE_SIZE:
+                raise ValueError(f"Invalid packet length {length}")
+            return await reader.readexactly(length)
+
+        payload = await asyncio.wait_for(read_response(), timeout=read_timeout)
+        latency_ms = (time.perf_counter() - started) * 1000
+        return parse_status_response(payload, latency_ms)
+    except asyncio.IncompleteReadError as e:
+        raise ValueError("Connection closed mid-response") from e
+    finally:
+        writer.close()
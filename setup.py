@@ -38,8 +38,10 @@ def setup():
     env_content.append(f"WEBHOOK_URL={webhook}")
     
     # 7. Concurrency
-    concurrency = input("Enter Concurrency Limit (default: 50): ").strip() or "50"
+    concurrency = input("Enter Deep Check Concurrency Limit (default: 50): ").strip() or "50"
     env_content.append(f"CONCURRENCY_LIMIT={concurrency}")
+    ping_concurrency = input("Enter Ping Concurrency (status pings in flight, default: 500): ").strip() or "500"
+    env_content.append(f"PING_CONCURRENCY={ping_concurrency}")
 
     with open(".env", "w") as f:
         f.write("\n".join(env_content))
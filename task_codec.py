@@ -0,0 +1,53 @@
+import json
+import socket
+import struct
+
+# Queue entries are tagged binary blobs instead of JSON:
+#   0x01 | 4-byte IPv4 | 2-byte port                  bare masscan hit (7 bytes)
+#   0x02 | 4-byte IPv4 | 2-byte port | JSON of extras  IPv4 target with more fields
+#   0x03 | JSON of the whole target                    hostnames, IPv6, anything else
+_PLAIN = 0x01
+_EXTRA = 0x02
+_JSON = 0x03
+_ADDR = struct.Struct("!B4sH")
+
+
+def _pack_ipv4(ip):
+    try:
+        return socket.inet_pton(socket.AF_INET, ip)
+    except (OSError, TypeError):
+        return None
+
+
+def target_key(target: dict) -> bytes:
+    """Identity of a target for deduplication, packed IPv4 + port when possible"""
+    packed = _pack_ipv4(target["ip"])
+    if packed is not None and 0 <= target["port"] <= 0xFFFF:
+        return packed + struct.pack("!H", target["port"])
+    return f"{target['ip']}:{target['port']}".encode("utf-8")
+
+
+def encode_task(target: dict) -> bytes:
+    packed = _pack_ipv4(target.get("ip"))
+    port = target.get("port")
+    if packed is None or not isinstance(port, int) or not 0 <= port <= 0xFFFF:
+        return bytes([_JSON]) + json.dumps(target, separators=(",", ":")).encode("utf-8")
+
+    if len(target) == 2:
+        return _ADDR.pack(_PLAIN, packed, port)
+    extras = {k: v for k, v in target.items() if k not in ("ip", "port")}
+    return _ADDR.pack(_EXTRA, packed, port) + json.dumps(extras, separators=(",", ":")).encode("utf-8")
+
+
+def decode_task(data: bytes) -> dict:
+    tag = data[0]
+    if tag == _JSON:
+        return json.loads(data[1:])
+
+    _, packed, port = _ADDR.unpack_from(data)
+    target = {"ip": socket.inet_ntop(socket.AF_INET, packed), "port": port}
+    if tag == _EXTRA:
+        target.update(json.loads(data[_ADDR.size:]))
+    elif tag != _PLAIN:
+        raise ValueError(f"Unknown task encoding {tag:#x}")
+    return target
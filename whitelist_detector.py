@@ -1,6 +1,7 @@
 import subprocess
 import json
 import logging
+import asyncio
 from config import CONFIG
 
 class WhitelistDetector:
@@ -28,3 +29,36 @@ class WhitelistDetector:
         except Exception as e:
             logging.error(f"Error checking whitelist for {ip}:{port}: {e}")
             return {"status": "error", "message": str(e)}
+
+    async def async_check_server(self, ip: str, port: int) -> dict:
+        """
+        Same as check_server, but runs the bot as an asyncio subprocess so the
+        event loop keeps running while it connects.
+        """
+        process = None
+        try:
+            process = await asyncio.create_subprocess_exec(
+                "node", self.js_path, ip, str(port),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            stdout, _ = await asyncio.wait_for(process.communicate(), timeout=CONFIG["WHITELIST_CHECK_TIMEOUT"])
+
+            output = stdout.decode("utf-8", errors="ignore").strip()
+            if output:
+                try:
+                    return json.loads(output)
+                except json.JSONDecodeError:
+                    return {"status": "error", "message": "Failed to parse Node output"}
+
+            return {"status": "offline", "message": "No response from bot"}
+
+        except asyncio.TimeoutError:
+            return {"status": "timeout", "message": "Check timed out"}
+        except Exception as e:
+            logging.error(f"Error checking whitelist for {ip}:{port}: {e}")
+            return {"status": "error", "message": str(e)}
+        finally:
+            if process and process.returncode is None:
+                process.kill()
+                await process.wait()